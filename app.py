@@ -1,7 +1,26 @@
-from flask import Flask, request, jsonify, render_template
-from flask_cors import CORS
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+from starlette.templating import Jinja2Templates
 import os
-import json
+import sys
+import orjson
+import asyncio
+import time
+import hashlib
+import gzip
+import logging
+import platform
+import re
+from array import array
+from dataclasses import dataclass
+from typing import Optional
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -9,33 +28,651 @@ load_dotenv()
 
 # Import our story generator
 try:
-    from main import generate_bedtime_story
+    from main import (
+        generate_bedtime_story, stream_bedtime_story, submit_story_batch, collect_chat_batch,
+        warm_up, close_client, client as openai_client, StoryGenError
+    )
     STORY_GENERATOR_AVAILABLE = True
 except ImportError:
+    openai_client = None
     STORY_GENERATOR_AVAILABLE = False
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+    class StoryGenError(Exception):
+        """Placeholder so handlers can still name the error type."""
+
+# Optional Hyperscan for the request content filter (falls back to re)
+try:
+    import hyperscan
+    HYPERSCAN_AVAILABLE = True
+except ImportError:
+    HYPERSCAN_AVAILABLE = False
+
+# Optional Redis story cache (exact match + RediSearch vector similarity)
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import RedisError, ResponseError
+    from redis.commands.search.field import TagField, VectorField
+    from redis.commands.search.query import Query
+    try:
+        from redis.commands.search.index_definition import IndexDefinition, IndexType
+    except ImportError:
+        from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+@asynccontextmanager
+async def lifespan(app):
+    """Warm the OpenAI connection and embedding model on startup; release pooled OpenAI/Redis connections on shutdown."""
+    if SETTINGS.story_generator_available:
+        await warm_up()
+    yield
+    if SETTINGS.story_generator_available:
+        await close_client()
+    if redis_client is not None:
+        await redis_client.aclose()
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse serialized with orjson."""
+    def render(self, content):
+        return orjson.dumps(content)
+
+templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "templates"))
 
 # Configuration
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-here')
+@dataclass(frozen=True, slots=True)
+class Settings:
+    """Process configuration, read from the environment once at import."""
+    has_api_key: bool
+    story_generator_available: bool
+    redis_url: Optional[str]
+    port: int
+    debug_mode: bool
+    version: str = '1.0.0'
+
+SETTINGS = Settings(
+    has_api_key=bool(os.environ.get('OPENAI_API_KEY')),
+    story_generator_available=STORY_GENERATOR_AVAILABLE,
+    redis_url=os.environ.get('REDIS_URL'),
+    port=int(os.environ.get('PORT', 5000)),
+    debug_mode=os.environ.get('STORY_DEBUG', '').lower() in ('1', 'true', 'yes')
+)
+
+# Accepted generation modes and the largest story request body we will parse
+_VALID_MODES = frozenset(('fast', 'balanced', 'best'))
+# The Batch API path only writes the one-shot strong-constraints story
+_BATCH_MODES = frozenset(('batch',))
+MAX_PAYLOAD_BYTES = 4096
+
+# io_uring completion-based loop needs a recent kernel
+URING_MIN_KERNEL = (5, 11)
+
+def _kernel_version():
+    """Return the running kernel as a (major, minor) tuple, or (0, 0) if unparseable."""
+    try:
+        return tuple(int(part) for part in platform.release().split('-')[0].split('.')[:2])
+    except ValueError:
+        return (0, 0)
+
+def install_event_loop_policy():
+    """
+    Install the fastest available asyncio event loop policy.
+
+    Prefers uringcore (io_uring) on Linux >= 5.11, which avoids an
+    epoll_wait/read/write syscall per loop iteration on the OpenAI hot path.
+    Falls back to uvloop, then to the stock asyncio loop.
+
+    Returns:
+        Name of the installed event loop
+    """
+    if sys.platform == 'linux' and _kernel_version() >= URING_MIN_KERNEL:
+        try:
+            import uringcore
+            asyncio.set_event_loop_policy(uringcore.EventLoopPolicy())
+            return 'uringcore'
+        except ImportError:
+            pass
+
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        return 'uvloop'
+    except ImportError:
+        return 'asyncio'
+
+# ============= STATIC PAYLOADS =============
+
+# Example requests and mode descriptions never change at runtime, so they are
+# serialized once here and every request reuses the same bytes
+EXAMPLES = [
+    {
+        'text': 'A story about a little dragon who is afraid of the dark',
+        'icon': 'dragon',
+        'category': 'fantasy'
+    },
+    {
+        'text': 'A story about a shy turtle who makes new friends',
+        'icon': 'turtle',
+        'category': 'friendship'
+    },
+    {
+        'text': 'An adventure where a robot learns about emotions',
+        'icon': 'robot',
+        'category': 'learning'
+    },
+    {
+        'text': 'A story about a brave bunny who goes on an adventure',
+        'icon': 'rabbit',
+        'category': 'adventure'
+    },
+    {
+        'text': 'A magical story about a unicorn who helps others',
+        'icon': 'unicorn',
+        'category': 'magic'
+    }
+]
+
+MODES = [
+    {
+        'id': 'fast',
+        'name': 'Fast Mode',
+        'description': 'Quick stories for simple requests',
+        'api_calls': 2,
+        'time': '5-8 seconds',
+        'quality': '7-8/10',
+        'icon': 'rocket'
+    },
+    {
+        'id': 'balanced',
+        'name': 'Balanced Mode',
+        'description': 'Default mode with great quality and efficiency',
+        'api_calls': '3-6',
+        'time': '12-15 seconds',
+        'quality': '8-9/10',
+        'icon': 'balance-scale'
+    },
+    {
+        'id': 'best',
+        'name': 'Best Mode',
+        'description': 'Premium quality with up to 2 refinements',
+        'api_calls': '6-11',
+        'time': '20-30 seconds',
+        'quality': '9-10/10',
+        'icon': 'gem'
+    }
+]
+
+_EXAMPLES_JSON = orjson.dumps({'success': True, 'examples': EXAMPLES})
+_MODES_JSON = orjson.dumps({'success': True, 'modes': MODES})
+
+# Payloads only change on deploy, so browsers/CDNs may cache them and revalidate by ETag
+STATIC_CACHE_CONTROL = 'public, max-age=3600, immutable'
+
+def _etag(body):
+    """Strong ETag for a pre-serialized payload."""
+    return '"' + hashlib.md5(body).hexdigest() + '"'
+
+_EXAMPLES_ETAG = _etag(_EXAMPLES_JSON)
+_MODES_ETAG = _etag(_MODES_JSON)
+
+def _cached_json_response(request, body, etag, cache_control=STATIC_CACHE_CONTROL):
+    """Return pre-serialized JSON, or 304 Not Modified if the client already has it."""
+    headers = {'ETag': etag, 'Cache-Control': cache_control}
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type='application/json', headers=headers)
+
+# ============= STORY CACHE =============
+
+redis_client = aioredis.from_url(SETTINGS.redis_url) if REDIS_AVAILABLE and SETTINGS.redis_url else None
+
+CACHE_TTL_SECONDS = 24 * 60 * 60
+CACHE_SIMILARITY_THRESHOLD = 0.95
+EMBEDDING_MODEL = 'text-embedding-3-small'
+EMBEDDING_DIM = 1536
+# v2 leaves the JSON payload out of the schema; drop a leftover 'story-cache'
+# index (FT.DROPINDEX story-cache) so it stops full-text indexing payloads
+CACHE_INDEX_NAME = 'story-cache-v2'
+CACHE_EXACT_PREFIX = 'story:exact:'
+CACHE_SEMANTIC_PREFIX = 'story:semantic:'
+
+# None = not checked yet, False = RediSearch unavailable (exact-match only)
+_semantic_index_ready = None
+
+def _cache_digest(story_request, mode):
+    """Hash a normalized request + mode into a stable cache key suffix."""
+    return hashlib.sha256((story_request.lower().strip() + mode).encode()).hexdigest()
+
+async def _ensure_semantic_index():
+    """Create the HNSW vector index on first use; remember if RediSearch is missing."""
+    global _semantic_index_ready
+    if _semantic_index_ready is not None:
+        return _semantic_index_ready
+
+    # The 'payload' hash field is only returned, never searched, so it stays
+    # out of the schema and RediSearch doesn't tokenize whole stories
+    schema = (
+        TagField('mode'),
+        VectorField('embedding', 'HNSW', {
+            'TYPE': 'FLOAT32',
+            'DIM': EMBEDDING_DIM,
+            'DISTANCE_METRIC': 'COSINE'
+        })
+    )
+    try:
+        await redis_client.ft(CACHE_INDEX_NAME).create_index(
+            schema,
+            definition=IndexDefinition(prefix=[CACHE_SEMANTIC_PREFIX], index_type=IndexType.HASH)
+        )
+        _semantic_index_ready = True
+    except ResponseError as e:
+        # "Index already exists" is fine; anything else means no RediSearch module
+        _semantic_index_ready = 'already exists' in str(e).lower()
+        if not _semantic_index_ready:
+            logger.warning("Semantic story cache disabled: %s", e)
+    return _semantic_index_ready
+
+async def _embed_request(story_request):
+    """Embed a story request as float32 bytes for the vector index."""
+    response = await openai_client.embeddings.create(model=EMBEDDING_MODEL, input=story_request)
+    return array('f', response.data[0].embedding).tobytes()
+
+async def lookup_cached_story(story_request, mode):
+    """
+    Look up a previously generated story for this request.
+
+    Tries an exact (normalized) match first, then the nearest cached request
+    of the same mode by embedding cosine similarity.
+
+    Returns:
+        (cached JSON bytes or None, request_embedding or None) - the bytes are
+        the full API response, ready to send as-is; the embedding is reused by
+        store_cached_story on a miss
+    """
+    if redis_client is None:
+        return None, None
+
+    digest = _cache_digest(story_request, mode)
+    embedding = None
+    try:
+        cached = await redis_client.get(CACHE_EXACT_PREFIX + digest)
+        if cached:
+            return cached, None
+
+        if openai_client is None or not await _ensure_semantic_index():
+            return None, None
+
+        embedding = await _embed_request(story_request)
+        query = (
+            Query(f'(@mode:{{{mode}}})=>[KNN 1 @embedding $vec AS distance]')
+            .return_fields('payload', 'distance')
+            .dialect(2)
+        )
+        results = await redis_client.ft(CACHE_INDEX_NAME).search(query, query_params={'vec': embedding})
+        if results.docs:
+            nearest = results.docs[0]
+            # COSINE distance in RediSearch is 1 - cosine similarity
+            if 1 - float(nearest.distance) >= CACHE_SIMILARITY_THRESHOLD:
+                cached = nearest.payload
+                return (cached.encode() if isinstance(cached, str) else cached), embedding
+    except RedisError as e:
+        logger.warning("Story cache lookup failed: %s", e)
+    except Exception as e:
+        logger.warning("Story cache embedding failed: %s", e)
+
+    return None, embedding
+
+async def store_cached_story(story_request, mode, response, embedding=None):
+    """
+    Cache a generated response for CACHE_TTL_SECONDS under its exact and semantic keys.
+
+    The response is stored already marked as a cache hit, so lookups can send
+    the stored bytes straight back without decoding and re-encoding them.
+    """
+    if redis_client is None:
+        return
+
+    digest = _cache_digest(story_request, mode)
+    payload = orjson.dumps({**response, 'metadata': {**response['metadata'], 'cache_hit': True}})
+    try:
+        await redis_client.setex(CACHE_EXACT_PREFIX + digest, CACHE_TTL_SECONDS, payload)
+        if embedding is not None:
+            key = CACHE_SEMANTIC_PREFIX + digest
+            await redis_client.hset(key, mapping={'mode': mode, 'payload': payload, 'embedding': embedding})
+            await redis_client.expire(key, CACHE_TTL_SECONDS)
+    except RedisError as e:
+        logger.warning("Story cache store failed: %s", e)
+
+def _accepts_gzip(accept_encoding):
+    """
+    Whether an Accept-Encoding header allows gzip.
+
+    gzip is accepted when listed with a nonzero q-value, or, if it isn't
+    listed, when "*" is; "gzip;q=0" refuses it.
+    """
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[coding] = q
+    for coding in ('gzip', 'x-gzip', '*'):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+async def index(request: Request):
+    """Serve the main HTML page (rendered once at startup, gzipped when accepted)."""
+    headers = {'Vary': 'Accept-Encoding'}
+    if _accepts_gzip(request.headers.get('accept-encoding', '')):
+        headers['Content-Encoding'] = 'gzip'
+        return Response(_INDEX_GZIP, media_type='text/html', headers=headers)
+    return Response(_INDEX_HTML, media_type='text/html', headers=headers)
+
+# ============= CONTENT FILTER =============
+
+# Requests mentioning these are turned away before any OpenAI call is made
+BLOCKED_TERMS = (
+    'gore', 'gory', 'murder', 'murders', 'murderer', 'torture', 'suicide', 'self-harm',
+    'sex', 'sexual', 'porn', 'pornographic', 'nsfw', 'cocaine', 'heroin', 'meth'
+)
+_BLOCKED_PATTERNS = [rf'\b{re.escape(term)}\b' for term in BLOCKED_TERMS]
+
+def _compile_content_filter():
+    """
+    Compile BLOCKED_TERMS once into a single matcher.
+
+    Uses one Hyperscan database (all terms scanned in a single pass) when the
+    module is installed, otherwise one case-insensitive stdlib alternation.
+
+    Returns:
+        Callable taking the request text and returning True if it is blocked
+    """
+    if HYPERSCAN_AVAILABLE:
+        db = hyperscan.Database()
+        db.compile(
+            expressions=[pattern.encode() for pattern in _BLOCKED_PATTERNS],
+            ids=list(range(len(_BLOCKED_PATTERNS))),
+            elements=len(_BLOCKED_PATTERNS),
+            flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH] * len(_BLOCKED_PATTERNS)
+        )
+
+        def _on_match(pattern_id, start, end, flags, matched):
+            matched.append(pattern_id)
+            return True  # stop at the first hit
+
+        def is_blocked(text):
+            matched = []
+            try:
+                db.scan(text.encode(), match_event_handler=_on_match, context=matched)
+            except hyperscan.ScanTerminated:
+                pass
+            return bool(matched)
+        return is_blocked
+
+    blocked = re.compile('|'.join(_BLOCKED_PATTERNS), re.IGNORECASE)
+    return lambda text: blocked.search(text) is not None
+
+is_blocked_request = _compile_content_filter()
+
+# ============= RATE LIMITING =============
+
+# Token bucket per client: bursts of up to RATE_LIMIT_CAPACITY story requests,
+# refilled at RATE_LIMIT_PER_MINUTE, so one client can't drain the OpenAI quota
+RATE_LIMIT_CAPACITY = 10
+RATE_LIMIT_PER_MINUTE = 10
+RATE_LIMIT_PREFIX = 'rl:'
+
+# KEYS[1] = bucket key; ARGV = capacity, refill tokens/sec, now (seconds)
+# Returns {allowed (0/1), seconds until the next token}
+_TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = math.ceil((1 - tokens) / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, retry_after}
+"""
+_token_bucket = redis_client.register_script(_TOKEN_BUCKET_LUA) if redis_client is not None else None
+
+class TokenBucket:
+    """In-process token bucket, used when Redis isn't configured (single process only)."""
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self):
+        """
+        Take one token if available.
+
+        Returns:
+            (allowed, seconds until the next token)
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True, 0
+        return False, int(-(-(1 - self.tokens) // self.rate))
+
+# client key -> TokenBucket, used when Redis isn't configured
+_local_buckets = {}
+
+async def _take_rate_limit_token(client_key):
+    """Spend one of the client's tokens; returns (allowed, retry_after_seconds)."""
+    rate = RATE_LIMIT_PER_MINUTE / 60
+    if _token_bucket is not None:
+        try:
+            allowed, retry_after = await _token_bucket(
+                keys=[RATE_LIMIT_PREFIX + client_key],
+                args=[RATE_LIMIT_CAPACITY, rate, time.time()]
+            )
+            return bool(allowed), int(retry_after)
+        except RedisError as e:
+            logger.warning("Rate limiter unavailable, using in-process bucket: %s", e)
+
+    bucket = _local_buckets.get(client_key)
+    if bucket is None:
+        bucket = _local_buckets[client_key] = TokenBucket(RATE_LIMIT_CAPACITY, rate)
+    return bucket.take()
+
+async def _check_rate_limit(request):
+    """Return a 429 response if this client is out of tokens, else None."""
+    client_key = request.client.host if request.client else 'unknown'
+    allowed, retry_after = await _take_rate_limit_token(client_key)
+    if allowed:
+        return None
+    return ORJSONResponse({
+        'success': False,
+        'error': 'Rate limit exceeded. Please wait before requesting another story.'
+    }, status_code=429, headers={'Retry-After': str(max(retry_after, 1))})
+
+# ============= REQUEST COALESCING =============
+
+# How long a duplicate request waits on an identical in-flight generation
+# before giving up and generating on its own (guards against hung pipelines)
+INFLIGHT_WAIT_SECONDS = 120
+
+# sha256(mode|request) -> future resolved with the in-flight generation's result
+_inflight = {}
+
+async def _coalesced_generate(story_request, mode):
+    """
+    Run generate_bedtime_story once per identical (request, mode) in flight.
+
+    A second caller with the same request awaits the first caller's result
+    instead of starting another full pipeline.
+    """
+    key = hashlib.sha256(f'{mode}|{story_request}'.encode()).hexdigest()
 
-@app.route('/')
-def index():
-    """Serve the main HTML page."""
-    return render_template('index.html')
+    pending = _inflight.get(key)
+    if pending is not None:
+        try:
+            return await asyncio.wait_for(asyncio.shield(pending), INFLIGHT_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning("Identical request still running after %ss, generating separately", INFLIGHT_WAIT_SECONDS)
+        except asyncio.CancelledError:
+            if not pending.cancelled():
+                raise
+            # The first caller went away mid-generation; run our own
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        result = await generate_bedtime_story(story_request, mode=mode)
+        future.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # mark retrieved; there may be no waiters
+        raise
+    finally:
+        if _inflight.get(key) is future:
+            del _inflight[key]
 
-@app.route('/api/generate-story', methods=['POST'])
-def generate_story():
+async def _read_story_payload(request, default_mode='balanced', valid_modes=_VALID_MODES):
+    """
+    Rate-limit, parse and validate a story request body.
+
+    Returns:
+        (payload, None) with payload['request'] stripped and payload['mode'] set,
+        or (None, error_response) if the client is rate limited or the body is invalid
+    """
+    limited = await _check_rate_limit(request)
+    if limited:
+        return None, limited
+
+    # Reject oversized bodies before reading or parsing them
+    too_large = ORJSONResponse({
+        'success': False,
+        'error': 'Payload too large'
+    }, status_code=413)
+    content_length = request.headers.get('content-length')
+    if content_length and content_length.isdigit() and int(content_length) > MAX_PAYLOAD_BYTES:
+        return None, too_large
+
+    # Chunked bodies carry no Content-Length; stop reading once past the limit
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > MAX_PAYLOAD_BYTES:
+            return None, too_large
+
+    try:
+        data = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        data = None
+
+    if not data or not isinstance(data, dict):
+        return None, ORJSONResponse({
+            'success': False,
+            'error': 'No JSON data provided'
+        }, status_code=400)
+
+    request_text = data.get('request', '')
+    data['request'] = request_text.strip() if isinstance(request_text, str) else ''
+    data['mode'] = data.get('mode', default_mode)
+
+    # Validate inputs
+    if not data['request']:
+        return None, ORJSONResponse({
+            'success': False,
+            'error': 'Story request is required'
+        }, status_code=400)
+
+    if is_blocked_request(data['request']):
+        return None, ORJSONResponse({
+            'success': False,
+            'error': "That request isn't suitable for a bedtime story. Please try something else."
+        }, status_code=400)
+
+    if not isinstance(data['mode'], str) or data['mode'] not in valid_modes:
+        return None, ORJSONResponse({
+            'success': False,
+            'error': ('Mode must be "fast", "balanced", or "best"' if valid_modes is _VALID_MODES
+                      else 'Batch stories only support mode "batch"')
+        }, status_code=400)
+
+    # Check if story generator is available
+    if not SETTINGS.story_generator_available:
+        return None, ORJSONResponse({
+            'success': False,
+            'error': 'Story generator not available. Please check API key configuration.'
+        }, status_code=500)
+
+    return data, None
+
+def _story_error_response(exc):
+    """Turn a StoryGenError into the API's error body and status code."""
+    return ORJSONResponse({
+        'success': False,
+        'error': exc.msg,
+        'code': exc.code
+    }, status_code=exc.http_status)
+
+def _story_response(result, mode):
+    """Shape a generate_bedtime_story result into the public API response."""
+    return {
+        'success': True,
+        'story': result.get('story', ''),
+        'metadata': {
+            'mode': result.get('mode', mode),
+            'category': result.get('category', 'unknown'),
+            'themes': result.get('themes', []),
+            'tone': result.get('tone', 'gentle'),
+            'score': result.get('final_score', 'N/A'),
+            'api_calls': result.get('api_calls', 0),
+            'iterations': result.get('iterations', 1),
+            'estimated_quality': result.get('estimated_quality', 'N/A'),
+            'cache_hit': False
+        }
+    }
+
+async def generate_story(request: Request):
     """
     API endpoint to generate bedtime stories.
-    
+
+    The OpenAI round-trips inside generate_bedtime_story are awaited, so a
+    single worker keeps serving other clients while a story is being written.
+
     Expected JSON payload:
     {
         "request": "A story about a brave little rabbit",
         "mode": "balanced"  // "fast", "balanced", or "best"
     }
-    
+
     Returns:
     {
         "success": true,
@@ -50,191 +687,317 @@ def generate_story():
         }
     }
     """
+    payload, error = await _read_story_payload(request)
+    if error:
+        return error
+
+    story_request = payload['request']
+    mode = payload['mode']
+
+    # Serve repeated / near-duplicate requests from the cache
+    cached, embedding = await lookup_cached_story(story_request, mode)
+    if cached:
+        return Response(cached, media_type='application/json')
+
+    # Generate story using our Tier 2 system
     try:
-        # Get request data
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                'success': False,
-                'error': 'No JSON data provided'
-            }), 400
-        
-        story_request = data.get('request', '').strip()
-        mode = data.get('mode', 'balanced')
-        
-        # Validate inputs
-        if not story_request:
-            return jsonify({
-                'success': False,
-                'error': 'Story request is required'
-            }), 400
-        
-        if mode not in ['fast', 'balanced', 'best']:
-            return jsonify({
+        result = await _coalesced_generate(story_request, mode)
+    except StoryGenError as e:
+        return _story_error_response(e)
+
+    response = _story_response(result, mode)
+    await store_cached_story(story_request, mode, response, embedding)
+    return ORJSONResponse(response)
+
+def _sse_frame(data, event=None):
+    """
+    Format one Server-Sent Events frame as bytes.
+
+    Args:
+        data: JSON-serializable payload, or already-serialized JSON bytes
+        event: Optional SSE event name
+    """
+    body = data if isinstance(data, bytes) else orjson.dumps(data)
+    frame = b'data: ' + body + b'\n\n'
+    return b'event: ' + event.encode() + b'\n' + frame if event else frame
+
+async def generate_story_stream(request: Request):
+    """
+    Stream a bedtime story as Server-Sent Events.
+
+    Takes the same JSON payload as /api/generate-story. Emits one
+    'data: {"token": "..."}' frame per story delta as it arrives from OpenAI,
+    then a final 'event: metadata' frame with the same body /api/generate-story
+    returns. In balanced/best mode the streamed draft may be refined afterwards;
+    the story in the metadata frame is the final text. Failures are reported as
+    an 'event: error' frame.
+    """
+    payload, error = await _read_story_payload(request)
+    if error:
+        return error
+
+    story_request = payload['request']
+    mode = payload['mode']
+
+    async def events():
+        cached, embedding = await lookup_cached_story(story_request, mode)
+        if cached:
+            yield _sse_frame(cached, event='metadata')
+            return
+
+        try:
+            async for kind, value in stream_bedtime_story(story_request, mode=mode):
+                if kind == 'token':
+                    yield _sse_frame({'token': value})
+                    continue
+
+                response = _story_response(value, mode)
+                await store_cached_story(story_request, mode, response, embedding)
+                yield _sse_frame(response, event='metadata')
+        except StoryGenError as e:
+            yield _sse_frame({
                 'success': False,
-                'error': 'Mode must be "fast", "balanced", or "best"'
-            }), 400
-        
-        # Check if story generator is available
-        if not STORY_GENERATOR_AVAILABLE:
-            return jsonify({
+                'error': e.msg,
+                'code': e.code
+            }, event='error')
+        except Exception:
+            # Headers are already sent, so the global handler can't answer for us
+            logger.exception('Unexpected error while streaming story')
+            yield _sse_frame({
                 'success': False,
-                'error': 'Story generator not available. Please check API key configuration.'
-            }), 500
-        
-        # Generate story using our Tier 2 system
+                'error': 'Internal server error'
+            }, event='error')
+
+    return StreamingResponse(
+        events(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# ============= BATCH JOBS =============
+
+BATCH_JOB_TTL_SECONDS = 48 * 60 * 60
+BATCH_JOB_PREFIX = 'story:batch:'
+
+# job_id -> job details, used when Redis isn't configured (single process only)
+_batch_jobs = {}
+
+async def _save_batch_job(job_id, job):
+    """Remember which request a batch job belongs to."""
+    if redis_client is not None:
         try:
-            result = generate_bedtime_story(story_request, mode=mode)
-            
-            # Prepare response
-            response = {
-                'success': True,
-                'story': result.get('story', ''),
-                'metadata': {
-                    'mode': result.get('mode', mode),
-                    'category': result.get('category', 'unknown'),
-                    'themes': result.get('themes', []),
-                    'tone': result.get('tone', 'gentle'),
-                    'score': result.get('final_score', 'N/A'),
-                    'api_calls': result.get('api_calls', 0),
-                    'iterations': result.get('iterations', 1),
-                    'estimated_quality': result.get('estimated_quality', 'N/A')
-                }
-            }
-            
-            return jsonify(response)
-            
-        except Exception as e:
-            return jsonify({
-                'success': False,
-                'error': f'Error generating story: {str(e)}'
-            }), 500
-            
-    except Exception as e:
-        return jsonify({
+            await redis_client.setex(BATCH_JOB_PREFIX + job_id, BATCH_JOB_TTL_SECONDS, orjson.dumps(job))
+            return
+        except RedisError as e:
+            logger.warning("Could not store batch job in Redis: %s", e)
+    _batch_jobs[job_id] = job
+
+async def _load_batch_job(job_id):
+    """Return the stored job details, or None for unknown job IDs."""
+    if redis_client is not None:
+        try:
+            stored = await redis_client.get(BATCH_JOB_PREFIX + job_id)
+            if stored:
+                return orjson.loads(stored)
+        except RedisError as e:
+            logger.warning("Could not load batch job from Redis: %s", e)
+    return _batch_jobs.get(job_id)
+
+async def generate_story_batch(request: Request):
+    """
+    Queue a story on the OpenAI Batch API (half price, up to 24h turnaround).
+
+    Expected JSON payload:
+    {
+        "request": "A story about a brave little rabbit",
+        "mode": "batch",   (optional; the only mode batch jobs support)
+        "async": true
+    }
+
+    Returns:
+    {
+        "success": true,
+        "job_id": "batch_abc123"
+    }
+
+    Poll /api/story-status/<job_id> for the result.
+    """
+    payload, error = await _read_story_payload(request, default_mode='batch', valid_modes=_BATCH_MODES)
+    if error:
+        return error
+
+    story_request = payload['request']
+
+    if payload.get('async') is not True:
+        return ORJSONResponse({
             'success': False,
-            'error': f'Server error: {str(e)}'
-        }), 500
+            'error': 'Batch generation requires "async": true; use /api/generate-story for interactive requests'
+        }, status_code=400)
 
-@app.route('/api/health', methods=['GET'])
-def health_check():
-    """Health check endpoint."""
-    return jsonify({
-        'status': 'healthy',
-        'story_generator_available': STORY_GENERATOR_AVAILABLE,
-        'api_key_configured': bool(os.environ.get('OPENAI_API_KEY')),
-        'version': '1.0.0'
+    try:
+        submitted = await submit_story_batch(story_request)
+    except StoryGenError as e:
+        return _story_error_response(e)
+
+    job_id = submitted['batch_id']
+    await _save_batch_job(job_id, {
+        'request': story_request,
+        'category_info': submitted['category_info']
     })
 
-@app.route('/api/examples', methods=['GET'])
-def get_examples():
-    """Get example story requests."""
-    examples = [
-        {
-            'text': 'A story about a little dragon who is afraid of the dark',
-            'icon': 'dragon',
-            'category': 'fantasy'
-        },
-        {
-            'text': 'A story about a shy turtle who makes new friends',
-            'icon': 'turtle',
-            'category': 'friendship'
-        },
-        {
-            'text': 'An adventure where a robot learns about emotions',
-            'icon': 'robot',
-            'category': 'learning'
-        },
-        {
-            'text': 'A story about a brave bunny who goes on an adventure',
-            'icon': 'rabbit',
-            'category': 'adventure'
-        },
-        {
-            'text': 'A magical story about a unicorn who helps others',
-            'icon': 'unicorn',
-            'category': 'magic'
-        }
-    ]
-    
-    return jsonify({
+    return ORJSONResponse({
         'success': True,
-        'examples': examples
-    })
+        'job_id': job_id
+    }, status_code=202)
 
-@app.route('/api/modes', methods=['GET'])
-def get_modes():
-    """Get available story generation modes."""
-    modes = [
-        {
-            'id': 'fast',
-            'name': 'Fast Mode',
-            'description': 'Quick stories for simple requests',
-            'api_calls': 2,
-            'time': '5-8 seconds',
-            'quality': '7-8/10',
-            'icon': 'rocket'
-        },
-        {
-            'id': 'balanced',
-            'name': 'Balanced Mode',
-            'description': 'Default mode with great quality and efficiency',
-            'api_calls': '5-6',
-            'time': '12-15 seconds',
-            'quality': '8-9/10',
-            'icon': 'balance-scale'
-        },
-        {
-            'id': 'best',
-            'name': 'Best Mode',
-            'description': 'Premium quality with guaranteed refinements',
-            'api_calls': '8-10',
-            'time': '20-30 seconds',
-            'quality': '9-10/10',
-            'icon': 'gem'
-        }
-    ]
-    
-    return jsonify({
+async def story_status(request: Request):
+    """Report a batch job's status, with the story once it has completed."""
+    job_id = request.path_params['job_id']
+    job = await _load_batch_job(job_id)
+    if job is None:
+        return ORJSONResponse({
+            'success': False,
+            'error': 'Unknown job ID'
+        }, status_code=404)
+
+    try:
+        batch = await collect_chat_batch(job_id)
+    except StoryGenError as e:
+        return _story_error_response(e)
+
+    if batch['status'] != 'completed':
+        return ORJSONResponse({
+            'success': True,
+            'job_id': job_id,
+            'status': batch['status']
+        })
+
+    story = batch['outputs'].get('story')
+    if story is None:
+        return ORJSONResponse({
+            'success': False,
+            'job_id': job_id,
+            'status': batch['status'],
+            'error': 'Batch completed without a story'
+        }, status_code=502)
+
+    category_info = job['category_info']
+    return ORJSONResponse({
         'success': True,
-        'modes': modes
+        'job_id': job_id,
+        'status': batch['status'],
+        'story': story,
+        'metadata': {
+            'mode': 'batch',
+            'category': category_info.get('category', 'unknown'),
+            'themes': category_info.get('themes', []),
+            'tone': category_info.get('tone', 'gentle'),
+            'score': 'N/A (not evaluated)',
+            'batched': True
+        }
     })
 
-@app.errorhandler(404)
-def not_found(error):
-    """Handle 404 errors."""
-    return jsonify({
+# Health status is fixed for the life of the process. It is revalidated on every
+# request (no-cache) rather than cached for an hour, so monitors never see a stale copy.
+_HEALTH_JSON = orjson.dumps({
+    'status': 'healthy',
+    'story_generator_available': SETTINGS.story_generator_available,
+    'api_key_configured': SETTINGS.has_api_key,
+    'cache_enabled': redis_client is not None,
+    'version': SETTINGS.version
+})
+_HEALTH_ETAG = _etag(_HEALTH_JSON)
+
+async def health_check(request: Request):
+    """Health check endpoint."""
+    return _cached_json_response(request, _HEALTH_JSON, _HEALTH_ETAG, cache_control='no-cache')
+
+async def get_examples(request: Request):
+    """Get example story requests."""
+    return _cached_json_response(request, _EXAMPLES_JSON, _EXAMPLES_ETAG)
+
+async def get_modes(request: Request):
+    """Get available story generation modes."""
+    return _cached_json_response(request, _MODES_JSON, _MODES_ETAG)
+
+async def not_found(request: Request, exc: HTTPException):
+    """Handle 404 (and other HTTP) errors."""
+    if exc.status_code == 404:
+        return ORJSONResponse({
+            'success': False,
+            'error': 'Endpoint not found'
+        }, status_code=404)
+    return ORJSONResponse({
         'success': False,
-        'error': 'Endpoint not found'
-    }), 404
+        'error': exc.detail
+    }, status_code=exc.status_code)
 
-@app.errorhandler(500)
-def internal_error(error):
-    """Handle 500 errors."""
-    return jsonify({
+async def internal_error(request: Request, exc: Exception):
+    """Log unexpected errors and answer with a generic 500 (no internals leaked)."""
+    logger.exception("Unhandled error on %s %s", request.method, request.url.path)
+    return ORJSONResponse({
         'success': False,
         'error': 'Internal server error'
-    }), 500
+    }, status_code=500)
+
+app = Starlette(
+    routes=[
+        Route('/', index),
+        Route('/api/generate-story', generate_story, methods=['POST']),
+        Route('/api/generate-story-stream', generate_story_stream, methods=['POST']),
+        Route('/api/generate-story-batch', generate_story_batch, methods=['POST']),
+        Route('/api/story-status/{job_id}', story_status),
+        Route('/api/health', health_check),
+        Route('/api/examples', get_examples),
+        Route('/api/modes', get_modes),
+        Mount('/static', StaticFiles(directory=os.path.join(BASE_DIR, 'static')), name='static'),
+    ],
+    middleware=[
+        # Enable CORS for all routes
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+    ],
+    exception_handlers={
+        HTTPException: not_found,
+        Exception: internal_error
+    },
+    lifespan=lifespan
+)
+
+# index.html has no per-request variables, so it is rendered (and compressed)
+# once here instead of on every page load. Static URLs are emitted as paths.
+_INDEX_HTML = templates.get_template('index.html').render(
+    url_for=lambda name, **path_params: app.url_path_for(name, **path_params)
+).encode()
+_INDEX_GZIP = gzip.compress(_INDEX_HTML)
 
 if __name__ == '__main__':
-    # Check if we're in development mode
-    debug_mode = os.environ.get('FLASK_ENV') == 'development'
-    
+    import uvicorn
+
+    # The reload supervisor serves from a child process that never runs this
+    # block, so with reload on uvicorn picks the loop itself (uvloop if installed)
+    if SETTINGS.debug_mode:
+        event_loop = 'uvicorn auto (reload mode)'
+    else:
+        event_loop = install_event_loop_policy()
+
     print("🌟 AI Bedtime Story Generator - Web Server")
     print("=" * 50)
-    print(f"Story Generator Available: {STORY_GENERATOR_AVAILABLE}")
-    print(f"API Key Configured: {bool(os.environ.get('OPENAI_API_KEY'))}")
-    print(f"Debug Mode: {debug_mode}")
+    print(f"Story Generator Available: {SETTINGS.story_generator_available}")
+    print(f"API Key Configured: {SETTINGS.has_api_key}")
+    print(f"Debug Mode: {SETTINGS.debug_mode}")
+    print(f"Event Loop: {event_loop} (io_uring needs Linux {URING_MIN_KERNEL[0]}.{URING_MIN_KERNEL[1]}+ and uringcore)")
     print("=" * 50)
-    
-    if not STORY_GENERATOR_AVAILABLE:
+
+    if not SETTINGS.story_generator_available:
         print("⚠️  Warning: Story generator not available!")
         print("Please check your OpenAI API key configuration.")
-    
-    # Run the app
-    app.run(
+
+    # Run the app on uvicorn with the loop policy installed above + httptools
+    uvicorn.run(
+        'app:app',
         host='0.0.0.0',
-        port=int(os.environ.get('PORT', 5000)),
-        debug=debug_mode
+        port=SETTINGS.port,
+        reload=SETTINGS.debug_mode,
+        loop='auto' if SETTINGS.debug_mode else 'none',
+        http='httptools'
     )
@@ -0,0 +1,39 @@
+"""
+Gunicorn configuration for production.
+
+Runs the Starlette app on uvicorn workers (one event loop per CPU core):
+    gunicorn -c gunicorn.conf.py app:app
+"""
+import os
+import multiprocessing
+
+from uvicorn_worker import UvicornWorker
+
+
+class StoryUvicornWorker(UvicornWorker):
+    """Uvicorn worker that keeps the event loop policy installed in post_fork."""
+    CONFIG_KWARGS = {"loop": "none", "http": "httptools"}
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = StoryUvicornWorker
+
+# X-Forwarded-For is only trusted from these addresses; a client reaching the
+# server directly could otherwise send a fresh fake IP with each request and
+# dodge the per-IP rate limit. Behind a proxy (e.g. the platform router), set
+# FORWARDED_ALLOW_IPS to the proxy's addresses or all users share its bucket.
+forwarded_allow_ips = os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+# Keep client connections open between requests instead of re-handshaking
+keepalive = 75
+
+# Best mode can take 20-30s; leave headroom before a worker is recycled
+timeout = 120
+graceful_timeout = 30
+
+
+def post_fork(server, worker):
+    """Install uringcore/uvloop in each worker before its event loop starts."""
+    from app import install_event_loop_policy
+    worker.log.info("Event loop: %s", install_event_loop_policy())
@@ -1,13 +1,47 @@
 import os
-import json
+import sys
+import re
+import argparse
+import orjson
+import asyncio
 import logging
-from typing import Dict, Any, List
-from openai import OpenAI
+import httpx
+import hashlib
+import random
+import threading
+from collections import OrderedDict, deque
+from dataclasses import asdict, dataclass, field
+from contextvars import ContextVar
+from typing import Dict, Any, List, Callable, AsyncIterator, Optional, Tuple
+from openai import AsyncOpenAI, APIError
+from openai.types.chat import ChatCompletion
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Optional HTTP/2 support for the OpenAI connection (httpx needs the h2 package)
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Optional local embeddings for the semantic categorization cache
+try:
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+    SEMANTIC_CACHE_AVAILABLE = True
+except ImportError:
+    SEMANTIC_CACHE_AVAILABLE = False
+
+# Optional on-disk memo for categorization/naming, shared across processes
+try:
+    import diskcache
+    DISKCACHE_AVAILABLE = True
+except ImportError:
+    DISKCACHE_AVAILABLE = False
+
 """
 Multi-Stage Bedtime Story Generator - Advanced System
 A sophisticated 6-stage pipeline with comprehensive quality assurance and efficiency optimizations.
@@ -26,7 +60,43 @@ User Request → Categorization → Name Generation → [Multi-Plan → Plan Jud
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
+class StoryGenError(Exception):
+    """
+    Story generation failure that callers can report without a traceback.
+    
+    Attributes:
+        code: Stable machine-readable error code (e.g. "api_key_missing")
+        msg: Short human-readable message, safe to return to clients
+        http_status: HTTP status the web layer should answer with
+    """
+    def __init__(self, code: str, msg: str, http_status: int = 500):
+        super().__init__(msg)
+        self.code = code
+        self.msg = msg
+        self.http_status = http_status
+
+API_KEY_MISSING_MSG = "OpenAI client not initialized. Please set OPENAI_API_KEY environment variable."
+
+def require_client():
+    """Raise StoryGenError if no OpenAI API key is configured."""
+    if not client:
+        raise StoryGenError("api_key_missing", API_KEY_MISSING_MSG, 503)
+
+# Pooled HTTP transport for OpenAI: keep-alive connections are reused across
+# calls and requests (no TCP+TLS handshake per call); connect failures retried.
+# With h2 installed the concurrent calls of a story are multiplexed as HTTP/2
+# streams over one connection instead of each taking its own.
+# Idle connections are kept for 30s (httpx defaults to 5s) so they survive the
+# gaps between a story's stages and between back-to-back requests
+OPENAI_HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=30.0)
+OPENAI_HTTP_TIMEOUT = 60.0
+# Retries the OpenAI SDK makes for each call on 408/409/429/5xx and connection
+# errors (exponential backoff, honoring Retry-After), so one rate-limited call
+# is retried on its own instead of failing the stage or the whole pipeline.
+# 4 retries = 5 attempts per call.
+OPENAI_MAX_RETRIES = 4
+
+# Initialize OpenAI client (async, shared by every request so the connection pool is reused)
 api_key = os.environ.get("OPENAI_API_KEY")
 if not api_key:
     print("OPENAI_API_KEY environment variable not set!")
@@ -34,50 +104,665 @@ if not api_key:
     print("The system will not work without a valid API key.\n")
     client = None
 else:
-    client = OpenAI(api_key=api_key)
+    client = AsyncOpenAI(
+        api_key=api_key,
+        max_retries=OPENAI_MAX_RETRIES,
+        timeout=OPENAI_HTTP_TIMEOUT,
+        http_client=httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(retries=2, limits=OPENAI_HTTP_LIMITS, http2=HTTP2_AVAILABLE),
+            timeout=OPENAI_HTTP_TIMEOUT
+        )
+    )
 MODEL = "gpt-3.5-turbo"
+# Model for the classification-style stages (categorizing a request, picking a
+# plan), which need no creative writing; set STORY_CLASSIFIER_MODEL (e.g. to
+# gpt-4o-mini) where a smaller, faster model is allowed. Writing, critique and
+# refinement always use MODEL.
+CLASSIFIER_MODEL = os.environ.get("STORY_CLASSIFIER_MODEL", MODEL)
+
+# Cap in-flight OpenAI requests across all stories to stay within RPM/TPM limits
+MAX_CONCURRENT_API_CALLS = 8
+_api_semaphore = asyncio.Semaphore(MAX_CONCURRENT_API_CALLS)
+
+# Per-story API call counter; context-local so concurrent stories don't mix counts
+_api_call_counter: ContextVar[List[int]] = ContextVar("api_call_counter")
+
+class RecentNames:
+    """
+    Bounded record of recently used names.
+    
+    A set gives O(1) membership checks and a deque keeps insertion order, so
+    once full the oldest name is forgotten (and becomes available again).
+    """
+    def __init__(self, maxlen: int):
+        self._order = deque(maxlen=maxlen)
+        self._names = set()
+    
+    def __contains__(self, name: str) -> bool:
+        return name in self._names
+    
+    def __len__(self) -> int:
+        return len(self._names)
+    
+    def add(self, name: str):
+        """Record a name as the most recently used."""
+        if name in self._names:
+            self._order.remove(name)
+        elif len(self._order) == self._order.maxlen:
+            self._names.discard(self._order[0])
+        self._order.append(name)
+        self._names.add(name)
+    
+    def update(self, names: List[str]):
+        """Record several names, in order."""
+        for name in names:
+            self.add(name)
+    
+    def recent(self, n: int) -> List[str]:
+        """The n most recently used names, oldest first."""
+        return list(self._order)[-n:]
+    
+    def clear(self):
+        """Forget every name."""
+        self._order.clear()
+        self._names.clear()
+
+# Names stay "used" until this many newer ones have been picked; kept below the
+# size of the local name bank so there are always unused names to draw from
+USED_NAMES_MAX = 200
 
 # Global name tracking to prevent repetition across sessions
-USED_NAMES = set()
+USED_NAMES = RecentNames(USED_NAMES_MAX)
 
 def reset_name_tracking():
     """Reset the global name tracking to start fresh."""
-    global USED_NAMES
     USED_NAMES.clear()
     logger.info("Name tracking reset, all names available again")
 
-# ============= CORE COMPONENTS =============
+async def warm_up_client():
+    """
+    Open a pooled connection to OpenAI ahead of the first story request.
+    
+    Resolves DNS and completes the TLS handshake with a cheap models.list()
+    call, so the first real request doesn't pay the cold-start latency.
+    """
+    if not client:
+        return
+    try:
+        await client.with_options(timeout=5.0).models.list()
+        logger.info("OpenAI connection warmed up (%s)", 'HTTP/2' if HTTP2_AVAILABLE else 'HTTP/1.1')
+    except Exception as e:
+        logger.warning("OpenAI warm-up failed (first request will connect cold): %s", e)
 
-def generate_unique_character_names(request: str, category_info: Dict[str, Any], num_names: int = 3) -> List[str]:
+async def warm_up():
     """
-    Generate unique character names based on story context.
+    Pay every cold-start cost ahead of the first story request.
+    
+    The OpenAI connection is opened while the embedding model of the semantic
+    cache loads in a worker thread.
+    """
+    await asyncio.gather(warm_up_client(), asyncio.to_thread(CATEGORY_SEMANTIC_CACHE.load_model))
+
+async def close_client():
+    """Close the shared OpenAI client and its connection pool."""
+    if client:
+        await client.close()
+
+def start_api_call_count() -> List[int]:
+    """Start counting OpenAI calls made by the current story; read the count from [0]."""
+    counter = [0]
+    _api_call_counter.set(counter)
+    return counter
+
+# System messages that other stages extend (e.g. the story judge rubric, reused
+# by the batched judge and the combined critique-and-rewrite); registered where
+# each is defined
+SHARED_SYSTEM_PREFIXES: List[str] = []
+
+def prompt_cache_key(system: str) -> str:
+    """
+    OpenAI prompt_cache_key for calls that start with this system message.
+    
+    Derived from the message text, so it is stable across processes and
+    changes whenever the stage's instructions do. A system message extending
+    one of SHARED_SYSTEM_PREFIXES gets that prefix's key, so every stage
+    sending the shared block is routed to the cache already holding it.
+    """
+    prefix = next((prefix for prefix in SHARED_SYSTEM_PREFIXES if system.startswith(prefix)), system)
+    return "story-" + hashlib.sha256(prefix.encode()).hexdigest()[:16]
+
+async def create_chat_completion(**kwargs):
+    """
+    Send a chat completion request to OpenAI.
+    
+    Calls sharing a system message carry the same prompt_cache_key, so OpenAI
+    routes them to the same cache and reuses the already processed prefix.
+    """
+    extra_body = {"prompt_cache_key": prompt_cache_key(kwargs["messages"][0]["content"]),
+                  **kwargs.pop("extra_body", {})}
+    return await client.chat.completions.create(extra_body=extra_body, **kwargs)
+
+async def chat_completion(**kwargs):
+    """
+    Issue a chat completion under the shared concurrency limit and count it.
+    
+    An identical earlier call is replayed from the completion cache instead.
+    """
+    key = completion_cache_key("chat", kwargs)
+    cached = await completion_cache_get(key)
+    if cached is not None:
+        return ChatCompletion.model_validate(cached)
+    async with _api_semaphore:
+        response = await create_chat_completion(**kwargs)
+    counter = _api_call_counter.get(None)
+    if counter is not None:
+        counter[0] += 1
+    # A reply cut off by max_tokens is not worth replaying
+    if response.choices and response.choices[0].finish_reason != "length":
+        await completion_cache_set(key, response.model_dump(mode="json"))
+    return response
+
+async def stream_chat_completion(on_token: Callable[[str], None], **kwargs) -> str:
+    """
+    Issue a streaming chat completion, passing each text delta to on_token.
+    
+    A completion replayed from the cache is passed to on_token in one piece.
+    
+    Returns:
+        The full completion text
+    """
+    key = completion_cache_key("stream", kwargs)
+    cached = await completion_cache_get(key)
+    if cached is not None:
+        on_token(cached)
+        return cached
+    parts = []
+    async with _api_semaphore:
+        stream = await create_chat_completion(stream=True, **kwargs)
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                on_token(delta)
+    counter = _api_call_counter.get(None)
+    if counter is not None:
+        counter[0] += 1
+    text = "".join(parts)
+    await completion_cache_set(key, text)
+    return text
+
+async def stream_json_completion(done: Callable[[Dict], bool], *,
+                                 drop_if_truncated: Tuple[str, ...] = (), cache: bool = True, **kwargs) -> Dict:
+    """
+    Stream a JSON completion, stopping as soon as the caller has what it needs.
+    
+    The document is re-parsed with parse_partial_json as deltas arrive; once
+    done(partial) returns True the stream is closed, so the caller neither
+    waits for nor pays for the trailing fields.
+    An undecodable answer gets one repair attempt (see repair_json_completion).
+    Only fully read, well-formed answers go into the completion cache, since
+    a cut-off one may lack fields another caller's done() waits for. An answer
+    truncated by max_tokens is salvaged (see load_json_completion) but never
+    cached.
     
     Args:
-        request: User's story request
-        category_info: Category information from categorizer
-        num_names: Number of names to generate
+        done: Predicate over the partially decoded object
+        drop_if_truncated: Fields left out of a salvaged answer, since their
+            text may end mid-sentence
+        cache: False to bypass the completion cache even at a low temperature
+            (for answers that carry creative text)
         
     Returns:
-        List of unique character names
+        The decoded object (complete, or as far as it was needed)
+    """
+    key = completion_cache_key("stream", kwargs) if cache else None
+    text = await completion_cache_get(key)
+    if text is None:
+        text = ""
+        result = None
+        async with _api_semaphore:
+            stream = await create_chat_completion(stream=True, **kwargs)
+            try:
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    text += delta
+                    partial = parse_partial_json(text)
+                    if isinstance(partial, dict) and done(partial):
+                        result = partial
+                        break
+            finally:
+                await stream.close()
+        counter = _api_call_counter.get(None)
+        if counter is not None:
+            counter[0] += 1
+        if result is not None:
+            return result
+        try:
+            decoded = orjson.loads(text)
+        except ValueError:
+            pass
+        else:
+            await completion_cache_set(key, text)
+            return decoded
+    try:
+        decoded = load_json_completion(text)
+    except ValueError:
+        return await repair_json_completion(text, **kwargs)
+    if isinstance(decoded, dict):
+        for name in drop_if_truncated:
+            decoded.pop(name, None)
+    return decoded
+
+JSON_REPAIR_MSG = "Your previous response was invalid JSON. Return only valid JSON matching the requested schema."
+
+async def json_chat_completion(**kwargs) -> Any:
     """
-    logger.info(f"🎭 Generating {num_names} unique character names...")
+    Issue a JSON-mode chat completion and decode it.
+    
+    An undecodable answer gets one repair attempt (see repair_json_completion).
     
-    category = category_info["category"]
-    themes = ", ".join(category_info["themes"])
+    Raises:
+        ValueError: if neither answer was decodable
+    """
+    response = await chat_completion(**kwargs)
+    text = response.choices[0].message.content
+    try:
+        return load_json_completion(text)
+    except ValueError:
+        return await repair_json_completion(text, **kwargs)
+
+async def repair_json_completion(text: str, **kwargs) -> Any:
+    """
+    Ask the model once more for valid JSON after an undecodable answer.
     
-    # Add used names to the prompt to avoid repetition
-    used_names_str = ", ".join(list(USED_NAMES)[:10]) if USED_NAMES else "None yet"
+    The bad answer is replayed as the assistant turn followed by
+    JSON_REPAIR_MSG, so the model fixes its own output instead of starting over.
     
-    prompt = f"""
-You are a creative children's book author who specializes in memorable character names.
+    Raises:
+        ValueError: if the repaired answer is still undecodable
+    """
+    logger.warning("Completion was not valid JSON; asking the model to repair it")
+    messages = kwargs.pop("messages") + [
+        {"role": "assistant", "content": text},
+        {"role": "user", "content": JSON_REPAIR_MSG}
+    ]
+    response = await chat_completion(messages=messages, **kwargs)
+    return load_json_completion(response.choices[0].message.content)
 
-Story Request: "{request}"
-Category: {category}
-Themes: {themes}
+def fields_complete(partial: Dict, *keys: str) -> bool:
+    """
+    True once every key has fully arrived in a partially streamed object.
+    
+    A value is only known to be complete when a later key has started, so the
+    most recently seen key must not be one of those asked for.
+    """
+    return all(key in partial for key in keys) and next(reversed(partial)) not in keys
+
+def load_json_completion(text: str) -> Any:
+    """
+    Decode a JSON-mode completion.
+    
+    JSON mode guarantees well-formed output unless the completion hit
+    max_tokens, so a truncated document is salvaged with parse_partial_json
+    before giving up.
+    
+    Raises:
+        ValueError: if nothing decodable was returned
+    """
+    try:
+        return orjson.loads(text)
+    except ValueError:
+        partial = parse_partial_json(text)
+        if partial is None:
+            raise
+        logger.warning("Completion JSON was truncated; using the fields received")
+        return partial
+
+def parse_partial_json(text: str) -> Any:
+    """
+    Parse a possibly truncated JSON document from a streaming completion.
+    
+    Closes any open string, array and object so the fields received so far can
+    be read before the completion finishes. If the tail can't be closed (e.g.
+    a half-written key or number), it is cut back to the last comma.
+    
+    Returns:
+        The decoded value, or None if nothing decodable has arrived yet
+    """
+    stack = []
+    in_string = escaped = False
+    cuts = []  # (index of a comma outside strings, closers needed there)
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            stack.append("}")
+        elif ch == "[":
+            stack.append("]")
+        elif ch in "}]" and stack:
+            stack.pop()
+        elif ch == ",":
+            cuts.append((i, "".join(reversed(stack))))
+    
+    if escaped:
+        text = text[:-1]
+    candidates = [text + ('"' if in_string else "") + "".join(reversed(stack))]
+    candidates.extend(text[:i] + closers for i, closers in reversed(cuts))
+    for candidate in candidates:
+        try:
+            return orjson.loads(candidate)
+        except ValueError:
+            continue
+    return None
+
+# ============= MEMOIZATION =============
+
+# Categorization and naming are a function of the request text, so repeat
+# requests reuse earlier answers instead of paying another round-trip
+MEMO_DIR = os.environ.get("STORY_MEMO_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".memo"))
+MEMO_MAX_ENTRIES = 1024
+MEMO_TTL_SECONDS = 7 * 24 * 60 * 60
+
+_memo_disk = diskcache.Cache(MEMO_DIR) if DISKCACHE_AVAILABLE else None
+_memo_local: "OrderedDict[str, Any]" = OrderedDict()
+
+def memo_key(*parts: Any) -> str:
+    """Content-address a memo entry by hashing its normalized inputs."""
+    return hashlib.sha256(orjson.dumps(parts, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+def memo_get(key: str) -> Any:
+    """Return a memoized value, or None on a miss."""
+    if _memo_disk is not None:
+        return _memo_disk.get(key)
+    value = _memo_local.get(key)
+    if value is not None:
+        _memo_local.move_to_end(key)
+    return value
+
+def memo_set(key: str, value: Any):
+    """Memoize a value (LRU-bounded in process, TTL-bounded on disk)."""
+    if _memo_disk is not None:
+        _memo_disk.set(key, value, expire=MEMO_TTL_SECONDS)
+        return
+    _memo_local[key] = value
+    _memo_local.move_to_end(key)
+    if len(_memo_local) > MEMO_MAX_ENTRIES:
+        _memo_local.popitem(last=False)
+
+async def memo_aget(key: str) -> Any:
+    """memo_get for coroutines; the disk read runs in a worker thread, off the event loop."""
+    if _memo_disk is not None:
+        return await asyncio.to_thread(memo_get, key)
+    return memo_get(key)
+
+async def memo_aset(key: str, value: Any):
+    """memo_set for coroutines; the disk write runs in a worker thread, off the event loop."""
+    if _memo_disk is not None:
+        await asyncio.to_thread(memo_set, key, value)
+        return
+    memo_set(key, value)
+
+def memo_delete(key: str):
+    """Forget a memoized value (no-op if absent)."""
+    if _memo_disk is not None:
+        _memo_disk.delete(key)
+        return
+    _memo_local.pop(key, None)
+
+# Best mode can checkpoint its progress into the memo store after each stage,
+# under a run id chosen by the caller (the CLI's --run-id), so an interrupted
+# run (Ctrl-C, crash) resumes from its last finished stage when rerun with the
+# same id. Runs without a run id are never checkpointed
+def checkpoint_key(run_id: str) -> str:
+    """Memo key of the checkpoint for one run."""
+    return memo_key("checkpoint", run_id)
+
+async def checkpoint_load(key: str) -> Dict[str, Any]:
+    """Outputs saved so far by an earlier, unfinished run ({} if none)."""
+    return await memo_aget(key) or {}
+
+async def checkpoint_save(key: str, checkpoint: Dict[str, Any]):
+    """Persist the checkpoint's finished-stage outputs."""
+    await memo_aset(key, dict(checkpoint))
+
+async def checkpoint_clear(key: str):
+    """Drop a finished run's checkpoint."""
+    if _memo_disk is not None:
+        await asyncio.to_thread(memo_delete, key)
+        return
+    memo_delete(key)
+
+class SemanticCache:
+    """
+    In-process nearest-neighbour cache keyed by request meaning.
+    
+    Requests are embedded locally (sentence-transformers, L2-normalized) and
+    compared by cosine similarity against every stored request, so rewordings
+    of an earlier request reuse its answer. The oldest entries are dropped
+    beyond max_entries. Without sentence-transformers it never hits.
+    """
+    def __init__(self, model_name: str, threshold: float, max_entries: int):
+        self.model_name = model_name
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._model = None
+        # Held while loading, so a warm-up thread and a lookup don't both load it
+        self._model_lock = threading.Lock()
+        self._vectors = []
+        self._values = []
+    
+    def load_model(self):
+        """
+        Load the embedding model now instead of on the first lookup.
+        
+        Safe to call from any thread; a failure is logged and left for the
+        first lookup to retry.
+        """
+        if not SEMANTIC_CACHE_AVAILABLE:
+            return
+        try:
+            self._load_model()
+        except Exception as e:
+            logger.warning("Embedding model warm-up failed: %s", e)
+    
+    def _load_model(self):
+        with self._model_lock:
+            if self._model is None:
+                self._model = SentenceTransformer(self.model_name)
+    
+    def _embed(self, text: str):
+        self._load_model()
+        return self._model.encode(text, normalize_embeddings=True)
+    
+    async def lookup(self, text: str) -> Tuple[Any, Any]:
+        """
+        Find the value stored for the most similar earlier text.
+        
+        Returns:
+            (value or None, embedding or None) - pass the embedding to store()
+            so a miss isn't embedded twice
+        """
+        if not SEMANTIC_CACHE_AVAILABLE:
+            return None, None
+        try:
+            # Encoding is CPU-bound; keep it off the event loop
+            embedding = await asyncio.to_thread(self._embed, text)
+        except Exception as e:
+            logger.warning("Semantic cache embedding failed: %s", e)
+            return None, None
+        if self._vectors:
+            similarities = np.stack(self._vectors) @ embedding
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                return self._values[best], embedding
+        return None, embedding
+    
+    def store(self, embedding: Any, value: Any):
+        """Remember a value under an embedding from lookup() (no-op without one)."""
+        if embedding is None:
+            return
+        self._vectors.append(embedding)
+        self._values.append(value)
+        if len(self._values) > self.max_entries:
+            del self._vectors[0], self._values[0]
+
+# Rewordings of a categorized request ("a small dragon scared of the dark")
+# reuse its categorization; 0.92 cosine keeps different topics apart
+CATEGORY_SEMANTIC_CACHE = SemanticCache(
+    os.environ.get("STORY_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"),
+    threshold=0.92,
+    max_entries=MEMO_MAX_ENTRIES
+)
+
+# Exact-match completion cache: a call with the same messages, model and
+# sampling settings as an earlier one replays its answer from the memo store.
+# Off unless STORY_COMPLETION_CACHE=1 (or the CLI's --cache), since it keeps
+# prompts on disk; the web app caches whole stories in Redis instead.
+COMPLETION_CACHE_ENABLED = os.environ.get("STORY_COMPLETION_CACHE", "0") == "1"
+# Only near-deterministic calls (categorizing, judging) are replayed; the
+# creative stages (plans, names, stories, refinements) always sample afresh
+COMPLETION_CACHE_MAX_TEMPERATURE = 0.3
+
+def completion_cache_key(kind: str, kwargs: Dict[str, Any]) -> Optional[str]:
+    """Memo key for a completion request, or None if it must not be cached."""
+    if not COMPLETION_CACHE_ENABLED or kwargs.get("temperature", 1.0) > COMPLETION_CACHE_MAX_TEMPERATURE:
+        return None
+    return memo_key("completion", kind, kwargs)
+
+async def completion_cache_get(key: Optional[str]) -> Any:
+    """Return a cached completion, or None on a miss (or with no key)."""
+    return await memo_aget(key) if key else None
+
+async def completion_cache_set(key: Optional[str], value: Any):
+    """Cache a completion (no-op with no key)."""
+    if key:
+        await memo_aset(key, value)
+
+def chat_messages(system: str, user: str) -> List[Dict[str, str]]:
+    """
+    Build a system + user message list.
+    
+    Fixed instructions go in the system message and only the per-request
+    details in the user message, so every call of a stage starts with an
+    identical prefix that OpenAI's prompt cache can reuse.
+    """
+    return [{"role": "system", "content": system}, {"role": "user", "content": user}]
+
+# ============= STORY DATA =============
+
+@dataclass(frozen=True, slots=True)
+class CategoryInfo:
+    """Categorizer output that steers naming, planning and writing."""
+    category: str
+    themes: Tuple[str, ...]
+    tone: str
+    # ", "-joined themes as every prompt shows them, built once per categorization
+    themes_text: str = field(init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        object.__setattr__(self, "themes_text", ", ".join(self.themes))
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CategoryInfo":
+        """
+        Build from a decoded categorizer answer (or a memoized asdict()).
+        
+        Raises:
+            KeyError: if a field is missing
+        """
+        return cls(category=data["category"], themes=tuple(data["themes"]), tone=data["tone"])
+
+@dataclass(frozen=True, slots=True)
+class Plan:
+    """One drafted story plan and the PLAN_APPROACHES key it was written for."""
+    plan_text: str
+    approach: str
+
+# ============= CORE COMPONENTS =============
+
+# Curated, culturally diverse name pools; names are drawn locally instead of
+# spending an API round-trip per story
+CATEGORY_NAMES: Dict[str, List[str]] = {
+    "animal": [
+        "Zara", "Koda", "Nina", "Pip", "Bramble", "Tiko", "Juniper", "Moss", "Amara", "Bao",
+        "Chidi", "Dasha", "Esme", "Fennel", "Gus", "Hana", "Ilo", "Jabari", "Kiri", "Lumi",
+        "Mako", "Nell", "Oki", "Pilar", "Quill", "Rosco", "Suki", "Taro", "Uma", "Wren"
+    ],
+    "adventure": [
+        "Aria", "Finn", "Maya", "Rohan", "Keanu", "Sol", "Tova", "Idris", "Zuri", "Mateo",
+        "Anouk", "Bodhi", "Calla", "Dario", "Emeka", "Freya", "Galen", "Haruto", "Isla", "Joaquin",
+        "Kenji", "Lior", "Mira", "Nico", "Odessa", "Paz", "Ravi", "Saoirse", "Tomas", "Yara"
+    ],
+    "friendship": [
+        "Leo", "Sage", "Ivy", "Amani", "Beatriz", "Cyrus", "Dani", "Elio", "Farah", "Gemma",
+        "Hugo", "Imani", "Jun", "Kaia", "Lena", "Milo", "Noor", "Otto", "Priya", "Quinn",
+        "Rafi", "Selin", "Teo", "Uzma", "Vera", "Wes", "Ximena", "Yusuf", "Zoe", "Arlo"
+    ],
+    "fantasy": [
+        "Orion", "Kai", "Elowen", "Thorne", "Isolde", "Caspian", "Seren", "Alaric", "Nyx", "Emrys",
+        "Rowan", "Ondine", "Pellam", "Lyra", "Cedric", "Anwen", "Tamsin", "Zephyr", "Briar", "Ilya",
+        "Morwen", "Sylas", "Faye", "Oberon", "Rhosyn", "Talia", "Evander", "Niamh", "Corin", "Ysolde"
+    ],
+    "bedtime": [
+        "Nova", "River", "Skye", "Lulu", "Mina", "Noa", "Poppy", "Remy", "Sunny", "Tali",
+        "Bea", "Coco", "Dov", "Elsie", "Fern", "Gigi", "Hiro", "Iris", "Jude", "Kiko",
+        "Lila", "Momo", "Nyla", "Opal", "Pia", "Rue", "Sora", "Tuck", "Vivi", "Wynn"
+    ],
+    "learning": [
+        "Phoenix", "Willow", "Ada", "Arjun", "Beni", "Clara", "Dev", "Emi", "Felix", "Grace",
+        "Hamid", "Ines", "Jonah", "Keiko", "Lucas", "Meera", "Nils", "Oren", "Parveen", "Rosalind",
+        "Sami", "Tariq", "Una", "Vikram", "Wanjiru", "Xavier", "Yuki", "Zain", "Amaya", "Basil"
+    ],
+    "family": [
+        "Ember", "Forest", "Rain", "Alma", "Bex", "Cleo", "Davi", "Eden", "Flora", "Gabe",
+        "Hollis", "Ingrid", "Jaya", "Kofi", "Lark", "Manu", "Nadia", "Olu", "Pita", "Rosa",
+        "Sefa", "Toby", "Ula", "Vida", "Waru", "Yemi", "Zora", "Ama", "Bruno", "Cora"
+    ],
+    "magic": [
+        "Stella", "Cosmo", "Aurora", "Astra", "Bellamy", "Celeste", "Dorian", "Estrella", "Fable", "Glimmer",
+        "Halcyon", "Indigo", "Jinx", "Kestrel", "Lucian", "Marisol", "Nimue", "Onyx", "Pixie", "Rune",
+        "Solenne", "Twyla", "Umbra", "Vesper", "Wisteria", "Xander", "Yvaine", "Zinnia", "Amethyst", "Bastian"
+    ]
+}
+DEFAULT_NAME_CATEGORY = "bedtime"
 
-NAMES ALREADY USED (avoid these): {used_names_str}
+def pick_character_names(category: str, num_names: int = 3) -> List[str]:
+    """
+    Sample character names from the local bank, avoiding names already used.
+    
+    Draws from the category's pool first, then from every pool, and only
+    repeats names once all of them have been used.
+    
+    Returns:
+        List of character names
+    """
+    pool = CATEGORY_NAMES.get(category, CATEGORY_NAMES[DEFAULT_NAME_CATEGORY])
+    available = [name for name in pool if name not in USED_NAMES]
+    if len(available) < num_names:
+        every_name = {name for names in CATEGORY_NAMES.values() for name in names}
+        available = sorted(name for name in every_name if name not in USED_NAMES)
+    if len(available) < num_names:
+        available = pool
+    
+    names = random.sample(available, num_names)
+    USED_NAMES.update(names)
+    return names
 
-Generate {num_names} unique, memorable character names for this story. Consider:
+SYSTEM_NAMER = """
+You are a creative children's book author who specializes in memorable character names.
 
 NAMING GUIDELINES:
 - Age-appropriate for children 5-10
@@ -86,9 +771,9 @@ NAMING GUIDELINES:
 - Match the story theme/category
 - Avoid common overused names (like "Max", "Luna", "Bella", "Charlie") 
 - Make them distinctive and memorable
-- DO NOT use any names from the "NAMES ALREADY USED" list above
+- DO NOT use any names from the "NAMES ALREADY USED" list
 
-For {category} stories with themes like {themes}, create names that:
+Create names that:
 - Fit the story's world and setting
 - Are unique but not too unusual
 - Sound pleasant when read aloud
@@ -97,79 +782,122 @@ For {category} stories with themes like {themes}, create names that:
 Respond with ONLY the names, one per line, no numbers or explanations.
 """
 
-    try:
-        if not client:
-            # Fallback names if API not available
-            fallback_names = {
-                "animal": ["Zara", "Koda", "Nina"],
-                "adventure": ["Aria", "Finn", "Maya"],
-                "friendship": ["Leo", "Sage", "Ivy"],
-                "fantasy": ["Orion", "Luna", "Kai"],
-                "bedtime": ["Nova", "River", "Skye"],
-                "learning": ["Phoenix", "Willow", "Sage"],
-                "family": ["Ember", "Forest", "Rain"],
-                "magic": ["Stella", "Cosmo", "Aurora"]
-            }
-            final_names = fallback_names.get(category, ["Zara", "Koda", "Nina"])[:num_names]
+PROMPT_NAMER = """
+NAMES ALREADY USED (avoid these): {used_names}
+
+Generate {num_names} unique character names for this story.
+
+Category: {category}
+Themes: {themes}
+Story Request: "{request}"
+"""
+
+def build_character_names_prompt(request: str, category_info: CategoryInfo, num_names: int = 3) -> str:
+    """Build the user message for SYSTEM_NAMER, listing names already used to avoid repeats."""
+    category = category_info.category
+    themes = category_info.themes_text
+    
+    return PROMPT_NAMER.format_map({
+        # Add used names to the prompt to avoid repetition
+        "used_names": ", ".join(USED_NAMES.recent(10)) if USED_NAMES else "None yet",
+        "num_names": num_names,
+        "category": category,
+        "themes": themes,
+        "request": request
+    })
+
+def parse_character_names(names_text: str, num_names: int = 3) -> List[str]:
+    """
+    Parse one-name-per-line output into exactly num_names names and record them as used.
+    
+    Returns:
+        List of character names
+    """
+    names = []
+    for line in names_text.strip().split('\n'):
+        name = line.strip()
+        # Remove numbers and dots from the beginning
+        if name:
+            # Remove leading numbers, dots, and spaces
+            clean_name = name.lstrip('0123456789. ')
+            if clean_name:
+                names.append(clean_name)
+    
+    # Ensure we have enough names
+    while len(names) < num_names:
+        names.append(f"Character{len(names) + 1}")
+    
+    # Track the names to avoid repetition in future generations
+    final_names = names[:num_names]
+    USED_NAMES.update(final_names)
+    return final_names
+
+async def generate_unique_character_names(request: str, category_info: CategoryInfo, num_names: int = 3,
+                                         enable_llm_names: bool = False) -> List[str]:
+    """
+    Generate unique character names based on story context.
+    
+    Names come from the local CATEGORY_NAMES bank by default (no API call).
+    With enable_llm_names the model invents names tailored to the request,
+    falling back to the bank on error.
+    
+    Args:
+        request: User's story request
+        category_info: Category information from categorizer
+        num_names: Number of names to generate
+        enable_llm_names: Ask the model instead of sampling the local bank
+        
+    Returns:
+        List of unique character names
+    """
+    logger.info("Generating %s unique character names...", num_names)
+    
+    if not enable_llm_names or not client:
+        final_names = pick_character_names(category_info.category, num_names)
+        logger.info("Picked names: %s", final_names)
+        return final_names
+    
+    # Reuse names generated for the same request, minus any used since
+    key = memo_key("names", request.strip().lower(), category_info.category, category_info.themes, num_names)
+    cached = await memo_aget(key)
+    if cached:
+        fresh = [name for name in cached if name not in USED_NAMES]
+        if len(fresh) >= num_names:
+            final_names = fresh[:num_names]
             USED_NAMES.update(final_names)
+            logger.info("Reusing memoized names: %s", final_names)
             return final_names
-        
-        response = client.chat.completions.create(
+    
+    prompt = build_character_names_prompt(request, category_info, num_names)
+
+    try:
+        response = await chat_completion(
             model=MODEL,
-            messages=[{"role": "user", "content": prompt}],
+            messages=chat_messages(SYSTEM_NAMER, prompt),
             temperature=0.7,
             max_tokens=100
         )
         
-        names_text = response.choices[0].message.content.strip()
-        names = []
-        for line in names_text.split('\n'):
-            name = line.strip()
-            # Remove numbers and dots from the beginning
-            if name:
-                # Remove leading numbers, dots, and spaces
-                clean_name = name.lstrip('0123456789. ')
-                if clean_name:
-                    names.append(clean_name)
-        
-        # Ensure we have enough names
-        while len(names) < num_names:
-            names.append(f"Character{len(names) + 1}")
-        
-        # Track the names to avoid repetition in future generations
-        final_names = names[:num_names]
-        USED_NAMES.update(final_names)
-        
-        logger.info(f"Generated names: {final_names}")
-        logger.info(f"Total names used so far: {len(USED_NAMES)}")
+        final_names = parse_character_names(response.choices[0].message.content, num_names)
+        await memo_aset(key, final_names)
+        
+        logger.info("Generated names: %s", final_names)
+        logger.info("Total names used so far: %s", len(USED_NAMES))
         return final_names
         
     except Exception as e:
-        logger.error(f"Error generating names: {e}")
-        # Fallback names
-        fallback_names = ["Zara", "Koda", "Nina", "Aria", "Finn"]
-        final_names = fallback_names[:num_names]
-        USED_NAMES.update(final_names)
-        return final_names
+        logger.error("Error generating names: %s", e)
+        return pick_character_names(category_info.category, num_names)
 
-def categorize_story_request(request: str) -> Dict[str, Any]:
-    """
-    Stage 1: Categorizer
-    Analyzes the user's story request to determine category, themes, and tone.
-    
-    Args:
-        request: User's story request
-        
-    Returns:
-        Dictionary with category, themes list, and tone
-    """
-    logger.info("Stage 1: Categorizing story request...")
-    
-    prompt = f"""
-You are a children's story expert and best selling author specializing in bedtime stories for ages 5-10. 
-Analyze the following story request and categorize it with themes and tone.
+# Used whenever plan drafting fails
+FALLBACK_PLAN = Plan("A gentle bedtime story with a positive message and happy ending.", "emotional")
 
-Story Request: "{request}"
+# Used whenever categorization fails
+FALLBACK_CATEGORY_INFO = CategoryInfo(category="bedtime", themes=("friendship", "kindness"), tone="gentle")
+
+SYSTEM_CATEGORIZER = """
+You are a children's story expert and best selling author specializing in bedtime stories for ages 5-10. 
+Analyze the story request and categorize it with themes and tone.
 
 Provide a JSON response with:
 - "category": One of [adventure, friendship, fantasy, bedtime, learning, family, animal, magic]
@@ -181,145 +909,315 @@ Guidelines:
 - Identify positive themes suitable for children
 - Select a tone that matches the request and is appropriate for bedtime
 - Be consistent and objective in your categorization
-
-Respond ONLY with valid JSON, no additional text.
 """
 
+PROMPT_CATEGORIZER = 'Story Request: "{request}"'
+
+def build_categorization_prompt(request: str) -> str:
+    """Build the user message for SYSTEM_CATEGORIZER."""
+    return PROMPT_CATEGORIZER.format_map({"request": request})
+
+async def categorize_story_request(request: str) -> CategoryInfo:
+    """
+    Stage 1: Categorizer
+    Analyzes the user's story request to determine category, themes, and tone.
+    
+    Args:
+        request: User's story request
+        
+    Returns:
+        CategoryInfo with category, themes, and tone
+    """
+    logger.info("Stage 1: Categorizing story request...")
+    
+    key = memo_key("category", request.strip().lower())
+    cached = await memo_aget(key)
+    if cached:
+        category_info = CategoryInfo.from_dict(cached)
+        logger.info("Categorized as: %s - %s tone (memoized)", category_info.category, category_info.tone)
+        return category_info
+    
+    similar, embedding = await CATEGORY_SEMANTIC_CACHE.lookup(request)
+    if similar:
+        category_info = CategoryInfo.from_dict(similar)
+        logger.info("Categorized as: %s - %s tone (similar request)", category_info.category, category_info.tone)
+        return category_info
+    
+    prompt = build_categorization_prompt(request)
+
     try:
         if not client:
-            raise Exception("OpenAI client not initialized. Please set OPENAI_API_KEY environment variable.")
+            raise Exception(API_KEY_MISSING_MSG)
         
-        response = client.chat.completions.create(
-            model=MODEL,
-            messages=[{"role": "user", "content": prompt}],
+        category_info = CategoryInfo.from_dict(await json_chat_completion(
+            model=CLASSIFIER_MODEL,
+            messages=chat_messages(SYSTEM_CATEGORIZER, prompt),
             temperature=0.3,
-            max_tokens=200
-        )
-        
-        category_info = json.loads(response.choices[0].message.content)
-        logger.info(f"Categorized as: {category_info['category']} - {category_info['tone']} tone")
+            max_tokens=150,
+            response_format={"type": "json_object"}
+        ))
+        logger.info("Categorized as: %s - %s tone", category_info.category, category_info.tone)
+        await memo_aset(key, asdict(category_info))
+        CATEGORY_SEMANTIC_CACHE.store(embedding, asdict(category_info))
         return category_info
         
     except Exception as e:
-        logger.error(f"Error in categorization: {e}")
+        logger.error("Error in categorization: %s", e)
         # Fallback categorization
-        return {"category": "bedtime", "themes": ["friendship", "kindness"], "tone": "gentle"}
+        return FALLBACK_CATEGORY_INFO
 
 # ============= MULTI-PLAN SELECTION =============
 
-def create_multiple_plans(request: str, category_info: Dict[str, Any], num_plans: int = 3) -> List[Dict]:
+# Plan variants generated by create_multiple_plans, one OpenAI call each
+PLAN_APPROACHES = {
+    "emotional": "Focus on character feelings, relationships, personal growth",
+    "action": "Focus on adventure, challenges, exciting events",
+    "discovery": "Focus on learning, exploration, problem-solving"
+}
+
+SYSTEM_PLANNER = """
+You are a creative story planner. Create a brief plan (4-6 sentences) for the story request
+using the approach you are given.
+
+The plan must cover:
+- Setup: Character and setting
+- Conflict: What problem arises?
+- Journey: How do they address it?
+- Resolution: How does it end positively?
+
+Return only the plan text, formatted as:
+SETUP: ... CONFLICT: ... JOURNEY: ... RESOLUTION: ...
+"""
+
+PROMPT_PLAN_CONTEXT = """Category: {category}
+Themes: {themes}
+Tone: {tone}
+"""
+PROMPT_PLANNER = """
+Approach: {approach} - {focus}
+{context}Request: "{request}"
+"""
+
+def plan_context(category_info: Optional[CategoryInfo]) -> str:
+    """Category lines for a planning prompt; empty when planning ahead of categorization."""
+    if category_info is None:
+        return ""
+    return PROMPT_PLAN_CONTEXT.format_map({
+        "category": category_info.category,
+        "themes": category_info.themes_text,
+        "tone": category_info.tone
+    })
+
+async def create_plan(request: str, category_info: Optional[CategoryInfo], approach: str) -> Plan:
     """
-    Generate multiple story plan variants.
-    
-    This catches structural problems BEFORE expensive story generation.
-    Better to evaluate 3 short plans than generate 3 full stories.
+    Generate one story plan for a single approach.
     
     Args:
         request: Original user request
         category_info: Output from categorizer
-        num_plans: Number of plans to generate (default 3)
+        approach: Key of PLAN_APPROACHES
         
     Returns:
-        List of plan objects with different approaches:
-        [
-            {"plan_text": "...", "approach": "emotional"},
-            {"plan_text": "...", "approach": "action"},
-            {"plan_text": "...", "approach": "discovery"}
-        ]
+        Plan(plan_text, approach), or None if the call failed
         
     API Calls: 1
     Temperature: 0.7 (creative variety)
     """
-    logger.info(f"Generating {num_plans} different story plans...")
-    
-    category = category_info["category"]
-    themes = ", ".join(category_info["themes"])
-    tone = category_info["tone"]
-    
-    prompt = f"""
-You are a creative story planner. Generate {num_plans} DIFFERENT story approaches for the same request. 
-Make each approach unique and compelling:
+    prompt = PROMPT_PLANNER.format_map({
+        "approach": approach.upper(),
+        "focus": PLAN_APPROACHES[approach],
+        "context": plan_context(category_info),
+        "request": request
+    })
+
+    try:
+        if not client:
+            raise Exception(API_KEY_MISSING_MSG)
+        
+        response = await chat_completion(
+            model=MODEL,
+            messages=chat_messages(SYSTEM_PLANNER, prompt),
+            temperature=0.7,
+            max_tokens=200,
+            # A plan is one paragraph; stop if the model starts padding it out
+            stop=["\n\n\n"]
+        )
+        
+        plan_text = response.choices[0].message.content.strip()
+        logger.info("   Plan (%s): %s...", approach, plan_text[:100])
+        return Plan(plan_text, approach)
+        
+    except Exception as e:
+        logger.error("Error generating %s plan: %s", approach, e)
+        return None
 
-Approach 1 (Emotional): Focus on character feelings, relationships, personal growth
-Approach 2 (Action): Focus on adventure, challenges, exciting events  
-Approach 3 (Discovery): Focus on learning, exploration, problem-solving
+SYSTEM_MULTI_PLANNER = """
+You are a creative story planner. Plan the story request {num_plans} different ways,
+one brief plan (4-6 sentences) per approach:
+{approaches}
 
-For each approach, create a brief plan (4-6 sentences) with:
+Each plan must cover:
 - Setup: Character and setting
 - Conflict: What problem arises?
 - Journey: How do they address it?
 - Resolution: How does it end positively?
 
-Request: "{request}"
-Category: {category}
-Themes: {themes}
-Tone: {tone}
+Return a JSON object with one plan per approach, in the order listed:
+{{
+    "plans": [
+        {{"plan_text": "SETUP: ... CONFLICT: ... JOURNEY: ... RESOLUTION: ...", "approach": "emotional"}},
+        {{"plan_text": "SETUP: ... CONFLICT: ... JOURNEY: ... RESOLUTION: ...", "approach": "action"}},
+        {{"plan_text": "SETUP: ... CONFLICT: ... JOURNEY: ... RESOLUTION: ...", "approach": "discovery"}}
+    ]
+}}
+""".format(
+    num_plans=len(PLAN_APPROACHES),
+    approaches="\n".join(f"- {approach}: {focus}" for approach, focus in PLAN_APPROACHES.items())
+)
 
-Return JSON array with {num_plans} plans:
-[
-    {{"plan_text": "SETUP: ... CONFLICT: ... JOURNEY: ... RESOLUTION: ...", "approach": "emotional"}},
-    {{"plan_text": "SETUP: ... CONFLICT: ... JOURNEY: ... RESOLUTION: ...", "approach": "action"}},
-    {{"plan_text": "SETUP: ... CONFLICT: ... JOURNEY: ... RESOLUTION: ...", "approach": "discovery"}}
-]
+PROMPT_MULTI_PLANNER = """
+{context}Request: "{request}"
 """
 
+async def create_multiple_plans(request: str, category_info: Optional[CategoryInfo] = None,
+                                num_plans: int = 3) -> List[Plan]:
+    """
+    Generate multiple story plan variants.
+    
+    This catches structural problems BEFORE expensive story generation.
+    Better to evaluate 3 short plans than generate 3 full stories.
+    
+    All approaches are planned in ONE JSON-mode call, so the request and
+    category context are sent once. If that answer can't be used, each
+    approach is planned by its own concurrent create_plan call instead.
+    
+    Without category_info the plans are drafted from the request alone, so
+    they can be written while the request is still being categorized.
+    
+    Args:
+        request: Original user request
+        category_info: Output from categorizer, or None
+        num_plans: Number of plans to generate (default 3, at most 3)
+        
+    Returns:
+        List of Plans with different approaches (emotional, action, discovery)
+        
+    API Calls: 1 (num_plans concurrent on fallback)
+    Temperature: 0.7 (creative variety)
+    """
+    logger.info("Generating %s different story plans...", num_plans)
+    
+    approaches = list(PLAN_APPROACHES)[:num_plans]
+    prompt = PROMPT_MULTI_PLANNER.format_map({"context": plan_context(category_info), "request": request})
+    
     try:
         if not client:
-            raise Exception("OpenAI client not initialized. Please set OPENAI_API_KEY environment variable.")
+            raise Exception(API_KEY_MISSING_MSG)
         
-        response = client.chat.completions.create(
+        result = await json_chat_completion(
             model=MODEL,
-            messages=[{"role": "user", "content": prompt}],
+            messages=chat_messages(SYSTEM_MULTI_PLANNER, prompt),
             temperature=0.7,
-            max_tokens=800
+            max_tokens=600,
+            response_format={"type": "json_object"}
         )
-        
-        plans = json.loads(response.choices[0].message.content)
-        logger.info(f"✅ Generated {len(plans)} different story plans")
-        for i, plan in enumerate(plans):
-            logger.info(f"   Plan {i+1} ({plan['approach']}): {plan['plan_text'][:100]}...")
-        return plans
+        plans = [Plan(plan["plan_text"], plan["approach"]) for plan in result["plans"]
+                 if plan.get("plan_text") and plan.get("approach") in approaches]
+        if not plans:
+            raise ValueError("no plans returned")
         
     except Exception as e:
-        logger.error(f"❌ Error generating multiple plans: {e}")
+        logger.error("Error drafting plans in one call: %s", e)
+        results = await asyncio.gather(*[create_plan(request, category_info, a) for a in approaches])
+        plans = [plan for plan in results if plan]
+    
+    if not plans:
         # Fallback single plan
-        return [{"plan_text": "A gentle bedtime story with a positive message and happy ending.", "approach": "emotional"}]
+        return [FALLBACK_PLAN]
+    
+    logger.info("Generated %s different story plans", len(plans))
+    return plans
+
+SYSTEM_CATEGORIZE_AND_PLAN = """
+You are a children's story expert and best selling author specializing in bedtime stories for ages 5-10.
+First analyze the story request, then plan it {num_plans} different ways.
+
+1. Categorize it:
+- "category": One of [adventure, friendship, fantasy, bedtime, learning, family, animal, magic]
+- "themes": List of 2-4 positive themes suitable for children (e.g., ["courage", "friendship", "kindness"])
+- "tone": One of [gentle, playful, adventurous, magical, cozy, educational]
+
+2. For each approach below, write a brief plan (4-6 sentences) that fits that category,
+themes and tone, covering Setup, Conflict, Journey and a positive Resolution:
+{approaches}
 
-def judge_plans(plans: List[Dict], request: str, category_info: Dict[str, Any]) -> Dict:
+Return a JSON object:
+{{
+    "category": "fantasy",
+    "themes": ["courage", "friendship"],
+    "tone": "gentle",
+    "plans": [
+        {{"plan_text": "SETUP: ... CONFLICT: ... JOURNEY: ... RESOLUTION: ...", "approach": "emotional"}},
+        {{"plan_text": "SETUP: ... CONFLICT: ... JOURNEY: ... RESOLUTION: ...", "approach": "action"}},
+        {{"plan_text": "SETUP: ... CONFLICT: ... JOURNEY: ... RESOLUTION: ...", "approach": "discovery"}}
+    ]
+}}
+""".format(
+    num_plans=len(PLAN_APPROACHES),
+    approaches="\n".join(f"- {approach}: {focus}" for approach, focus in PLAN_APPROACHES.items())
+)
+
+async def categorize_and_plan(request: str) -> Tuple[CategoryInfo, List[Plan]]:
     """
-    Evaluate all plans and select the best one.
+    Categorize the request and draft all plan variants in ONE call.
     
-    ONE API call evaluates all plans together, saving tokens compared to
-    generating multiple full stories.
+    Planning only needs the category to steer it, so asking for both at once
+    saves the categorization round-trip (and its prompt tokens) before planning.
+    Falls back to the separate categorize + plan calls if the combined answer
+    can't be used.
     
     Args:
-        plans: List of plan objects from create_multiple_plans
-        request: Original user request
-        category_info: Output from categorizer
+        request: User's story request
         
     Returns:
-        {
-            "plans": [...],  # Each with scores and analysis
-            "best_plan_index": 1,
-            "best_plan": {...},
-            "reasoning": "..."
-        }
+        (category_info, plans) shaped like categorize_story_request and
+        create_multiple_plans return them
         
     API Calls: 1
-    Temperature: 0.2 (analytical)
+    Temperature: 0.5 (consistent categories, varied plans)
     """
-    logger.info("Judging all story plans to select the best...")
+    logger.info("Stage 1: Categorizing and planning story request in one call...")
     
-    category = category_info["category"]
-    themes = ", ".join(category_info["themes"])
-    
-    # Format plans for evaluation
-    plans_text = ""
-    for i, plan in enumerate(plans):
-        plans_text += f"\nPlan {i+1} ({plan['approach']}):\n{plan['plan_text']}\n"
-    
-    prompt = f"""
-You are a story editor evaluating {len(plans)} different story approaches. 
+    prompt = build_categorization_prompt(request)
+
+    try:
+        if not client:
+            raise Exception(API_KEY_MISSING_MSG)
+        
+        result = await json_chat_completion(
+            model=MODEL,
+            messages=chat_messages(SYSTEM_CATEGORIZE_AND_PLAN, prompt),
+            temperature=0.5,
+            max_tokens=700,
+            response_format={"type": "json_object"}
+        )
+        category_info = CategoryInfo.from_dict(result)
+        plans = [Plan(plan["plan_text"], plan["approach"]) for plan in result["plans"] if plan.get("plan_text")]
+        if not plans:
+            raise ValueError("no plans returned")
+        
+        await memo_aset(memo_key("category", request.strip().lower()), asdict(category_info))
+        logger.info("Categorized as: %s - %s tone", category_info.category, category_info.tone)
+        logger.info("Generated %s different story plans", len(plans))
+        return category_info, plans
+        
+    except Exception as e:
+        logger.error("Error in combined categorize + plan: %s", e)
+        category_info = await categorize_story_request(request)
+        return category_info, await create_multiple_plans(request, category_info, num_plans=3)
+
+SYSTEM_PLAN_JUDGE = """
+You are a story editor evaluating different story approaches for the same request.
 Score each plan on these criteria (1-10 each):
 
 1. ORIGINALITY: Is it creative and unique, or generic?
@@ -334,122 +1232,178 @@ Score each plan on these criteria (1-10 each):
 10. CLEAR_PLOT: Does it have a clear plot?
 11. CLEAR_RESOLUTION: Does it have a clear resolution?
 
-
-
-
-
-
-
-
-
-
-Original request: "{request}"
-Target category: {category}
-Target themes: {themes}
-
-Plans to evaluate:
-{plans_text}
-
 For each plan, provide:
 - Scores for each criterion (1-10)
 - Total score
 - Key strengths
 - Key weaknesses
 
-Then select the BEST plan and explain why.
+First explain which plan is BEST and why, then give its 0-based index, then the
+per-plan scores. Refer to plans by their index; do not repeat the plan text.
 
-Return JSON:
-{{
+Return a JSON object with the keys in this order:
+{
+    "reasoning": "Plan 1 has the strongest emotional arc and clearest resolution...",
+    "best_plan_index": 1,
     "plans": [
-        {{
+        {
             "index": 0,
-            "scores": {{"originality": 8, "narrative_potential": 7, "alignment": 9, "child_appeal": 8}},
+            "scores": {"originality": 8, "narrative_potential": 7, "alignment": 9, "child_appeal": 8},
             "total": 32,
             "strengths": ["Clear character motivation", "Age-appropriate conflict"],
             "weaknesses": ["Generic resolution", "Limited emotional depth"]
-        }},
+        },
         ...
-    ],
-    "best_plan_index": 1,
-    "best_plan": {{"plan_text": "...", "approach": "..."}},
-    "reasoning": "Plan 2 has the strongest emotional arc and clearest resolution..."
-}}
+    ]
+}
 """
 
-    try:
-        if not client:
-            raise Exception("OpenAI client not initialized. Please set OPENAI_API_KEY environment variable.")
-        
-        response = client.chat.completions.create(
-            model=MODEL,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.2,
-            max_tokens=1000
-        )
+# Local plan pre-selection: plans this similar (word-set Jaccard) are interchangeable
+PLAN_SIMILARITY_THRESHOLD = 0.8
+# Word count a 4-6 sentence plan should land in
+PLAN_WORD_RANGE = (40, 160)
+
+def plan_words(plan_text: str) -> List[str]:
+    """Lowercased words of a plan, for the local pre-selection heuristic."""
+    return re.findall(r"[a-z']+", plan_text.lower())
+
+def pick_plan_locally(plans: List[Plan], category_info: CategoryInfo) -> Dict:
+    """
+    Pick a plan without the LLM judge when the choice is obvious.
+    
+    A plan is picked when the plans are near-identical (any pair above
+    PLAN_SIMILARITY_THRESHOLD, so judging them is a coin flip) or when one plan
+    mentions strictly more of the target themes than every other and has a
+    sensible length.
+    
+    Args:
+        plans: List of plan objects from create_multiple_plans
+        category_info: Output from categorizer
         
-        judge_result = json.loads(response.choices[0].message.content)
-        best_index = judge_result["best_plan_index"]
-        logger.info(f"✅ Plan evaluation complete. Best plan: #{best_index + 1} ({plans[best_index]['approach']})")
-        logger.info(f"   Reasoning: {judge_result['reasoning'][:100]}...")
-        return judge_result
+    Returns:
+        A judge_plans-shaped result, or None if the LLM judge should decide
         
-    except Exception as e:
-        logger.error(f"❌ Error judging plans: {e}")
-        # Fallback to first plan
-        return {
-            "plans": [{"index": 0, "total": 30, "strengths": ["Simple structure"], "weaknesses": ["Generic"]}],
-            "best_plan_index": 0,
-            "best_plan": plans[0],
-            "reasoning": "Fallback selection due to error"
-        }
+    API Calls: 0
+    """
+    def result(index: int, reasoning: str) -> Dict:
+        logger.info("Plan selected locally: #%s (%s) - %s", index + 1, plans[index].approach, reasoning)
+        return {"reasoning": reasoning, "best_plan_index": index, "best_plan": plans[index], "plans": []}
+    
+    if len(plans) == 1:
+        return result(0, "Only one plan available")
+    
+    words = [plan_words(plan.plan_text) for plan in plans]
+    word_sets = [set(w) for w in words]
+    themes = [theme.lower() for theme in category_info.themes]
+    theme_hits = [sum(theme in plan.plan_text.lower() for theme in themes) for plan in plans]
+    best = max(range(len(plans)), key=lambda i: theme_hits[i])
+    
+    similarity = max(
+        len(word_sets[i] & word_sets[j]) / (len(word_sets[i] | word_sets[j]) or 1)
+        for i in range(len(plans)) for j in range(i + 1, len(plans))
+    )
+    if similarity > PLAN_SIMILARITY_THRESHOLD:
+        return result(best, f"Plans are near-identical (similarity {similarity:.2f})")
+    
+    low, high = PLAN_WORD_RANGE
+    runner_up = max(hits for i, hits in enumerate(theme_hits) if i != best)
+    if theme_hits[best] > runner_up and low <= len(words[best]) <= high:
+        return result(best, f"Covers the most target themes ({theme_hits[best]} of {len(themes)})")
+    
+    return None
 
-# ============= STRUCTURED CRITIQUE =============
+PROMPT_PLAN_JUDGE = """
+Target category: {category}
+Target themes: {themes}
+Original request: "{request}"
+
+Plans to evaluate ({num_plans}):
+{plans}
+"""
+PROMPT_PLAN_ENTRY = "\nPlan {index} ({approach}):\n{plan_text}\n"
 
-def judge_story_v2(story: str, request: str, category_info: Dict[str, Any]) -> Dict:
+# Reasoning reported when plan judging fails and the first plan is used
+FALLBACK_PLAN_REASONING = "Fallback selection due to error"
+
+async def judge_plans(plans: List[Plan], request: str, category_info: CategoryInfo) -> Dict:
     """
-    Judge story with structured, actionable feedback.
+    Evaluate all plans and select the best one.
     
-    Instead of vague suggestions like "improve engagement", this provides
-    specific issues with locations, problems, and concrete fixes.
+    ONE API call grades all plans together (JSON mode), saving tokens compared to
+    judging each plan separately or generating multiple full stories. The choice
+    is streamed first and the stream is closed before the per-plan scores.
     
     Args:
-        story: Generated story text
+        plans: List of plan objects from create_multiple_plans
         request: Original user request
         category_info: Output from categorizer
         
     Returns:
         {
-            "scores": {...},
-            "overall_score": 7.8,
-            "verdict": "ACCEPT" | "REVISE",
-            "strengths": ["...", "..."],
-            "issues": [
-                {
-                    "location": "paragraph 2",
-                    "problem": "Dragon's fear is stated but never explained",
-                    "fix": "Add one sentence showing WHY dragon fears dark",
-                    "severity": "moderate"
-                }
-            ]
+            "reasoning": "...",
+            "best_plan_index": 1,
+            "best_plan": {...},
+            "plans": [...]  # Per-plan scores, possibly cut short
         }
         
     API Calls: 1
     Temperature: 0.2 (analytical)
     """
-    logger.info("🔍 TIER 2: Structured critique of story...")
-    
-    category = category_info["category"]
-    themes = ", ".join(category_info["themes"])
+    logger.info("Judging all story plans to select the best...")
     
-    prompt = f"""
-You are an expert children's literature editor. Evaluate this story with SPECIFIC, ACTIONABLE feedback.
+    prompt = PROMPT_PLAN_JUDGE.format_map({
+        "category": category_info.category,
+        "themes": category_info.themes_text,
+        "request": request,
+        "num_plans": len(plans),
+        # Format plans for evaluation
+        "plans": "".join(PROMPT_PLAN_ENTRY.format(index=i, approach=plan.approach, plan_text=plan.plan_text)
+                         for i, plan in enumerate(plans))
+    })
 
-Story to evaluate:
-{story}
+    try:
+        if not client:
+            raise Exception(API_KEY_MISSING_MSG)
+        
+        # Only the choice and its reasoning are used downstream, so stop reading
+        # once the per-plan scores start
+        judge_result = await stream_json_completion(
+            lambda partial: fields_complete(partial, "reasoning", "best_plan_index"),
+            model=CLASSIFIER_MODEL,
+            messages=chat_messages(SYSTEM_PLAN_JUDGE, prompt),
+            temperature=0.2,
+            max_tokens=700,
+            response_format={"type": "json_object"}
+        )
+        
+        best_index = judge_result.get("best_plan_index")
+        # A negative index would silently pick from the end; anything invalid gets plan 0
+        if isinstance(best_index, bool) or not isinstance(best_index, int) or not 0 <= best_index < len(plans):
+            logger.warning("Plan judge returned invalid plan index %r; using plan #1", best_index)
+            best_index = judge_result["best_plan_index"] = 0
+        # The judge only returns the index; take the plan itself from our own list
+        judge_result["best_plan"] = plans[best_index]
+        # Reasoning is informational; a missing one mustn't discard a valid pick
+        reasoning = judge_result.get("reasoning", "")
+        judge_result["reasoning"] = reasoning if isinstance(reasoning, str) else ""
+        logger.info("Plan evaluation complete. Best plan: #%s (%s)", best_index + 1, plans[best_index].approach)
+        logger.info("   Reasoning: %s...", judge_result['reasoning'][:100])
+        return judge_result
+        
+    except Exception as e:
+        logger.error("Error judging plans: %s", e)
+        # Fallback to first plan
+        return {
+            "plans": [{"index": 0, "total": 30, "strengths": ["Simple structure"], "weaknesses": ["Generic"]}],
+            "best_plan_index": 0,
+            "best_plan": plans[0],
+            "reasoning": FALLBACK_PLAN_REASONING
+        }
 
-Original request: "{request}"
-Target category: {category}
-Target themes: {themes}
+# ============= STRUCTURED CRITIQUE =============
+
+SYSTEM_STORY_JUDGE = """
+You are an expert children's literature editor. Evaluate stories with SPECIFIC, ACTIONABLE feedback.
 
 Provide scores (1-10) for:
 - age_appropriateness: Vocabulary and content suitable for ages 5-10
@@ -467,14 +1421,14 @@ For any score below 8, identify SPECIFIC issues:
 Also list the story's strengths to preserve during revision.
 
 Return JSON(example shown below):
-{{
-    "scores": {{
+{
+    "scores": {
         "age_appropriateness": 8,
         "engagement": 7,
         "structure": 9,
         "educational_value": 8,
         "bedtime_suitability": 7
-    }},
+    },
     "overall_score": 7.8,
     "verdict": "ACCEPT",
     "strengths": [
@@ -482,50 +1436,167 @@ Return JSON(example shown below):
         "Age-appropriate vocabulary throughout"
     ],
     "issues": [
-        {{
+        {
             "location": "opening paragraph",
             "problem": "Character introduction is rushed - we don't know what dragon looks like",
             "fix": "Add 1-2 sentences describing dragon's appearance and personality",
             "severity": "moderate"
-        }},
-        {{
+        },
+        {
             "location": "middle section", 
             "problem": "Transition between scenes is abrupt",
             "fix": "Add transitional sentence like 'The next evening, Dragon decided to try again.'",
             "severity": "minor"
-        }}
+        }
     ]
-}}
+}
 
 Acceptance criteria: Overall score >= 7.5 = "ACCEPT", < 7.5 = "REVISE"
 """
+SHARED_SYSTEM_PREFIXES.append(SYSTEM_STORY_JUDGE)
+
+PROMPT_STORY_JUDGE = """
+Evaluate this story.
+
+Original request: "{request}"
+Target category: {category}
+Target themes: {themes}
+
+Story to evaluate:
+{story}
+"""
+
+# Overall score a story needs for an ACCEPT verdict (as SYSTEM_STORY_JUDGE states)
+ACCEPT_SCORE = 7.5
+ISSUE_SEVERITIES = ("critical", "moderate", "minor")
+
+def normalize_judgment(judgment: Dict) -> Dict:
+    """
+    Check a decoded judge answer against the judge_story_v2 result shape.
+    
+    JSON mode guarantees valid JSON, not the fields we ask for, so a judgment
+    is coerced here once instead of every caller guarding against it: scores
+    become floats, a missing overall_score is averaged from the scores, an
+    unknown verdict is derived from the score, and issues without a problem
+    are dropped (an unknown severity counts as "moderate").
+    
+    Raises:
+        TypeError, ValueError: if the answer holds no usable score
+    """
+    scores = {name: float(score) for name, score in (judgment.get("scores") or {}).items()}
+    if "overall_score" in judgment:
+        overall_score = float(judgment["overall_score"])
+    elif scores:
+        overall_score = round(sum(scores.values()) / len(scores), 1)
+    else:
+        raise ValueError("judgment has no scores")
+    
+    verdict = str(judgment.get("verdict", "")).upper()
+    if verdict not in ("ACCEPT", "REVISE"):
+        verdict = "ACCEPT" if overall_score >= ACCEPT_SCORE else "REVISE"
+    
+    issues = []
+    for issue in judgment.get("issues") or []:
+        if not isinstance(issue, dict) or not issue.get("problem"):
+            continue
+        severity = str(issue.get("severity", "")).lower()
+        issues.append({
+            "location": str(issue.get("location") or "story"),
+            "problem": str(issue["problem"]),
+            "fix": str(issue.get("fix") or ""),
+            "severity": severity if severity in ISSUE_SEVERITIES else "moderate"
+        })
+    
+    return {
+        "scores": scores,
+        "overall_score": overall_score,
+        "verdict": verdict,
+        "strengths": [str(strength) for strength in judgment.get("strengths") or []],
+        "issues": issues
+    }
+
+async def judge_story_v2(story: str, request: str, category_info: CategoryInfo,
+                         feedback: str = "always") -> Dict:
+    """
+    Judge story with structured, actionable feedback.
+    
+    Instead of vague suggestions like "improve engagement", this provides
+    specific issues with locations, problems, and concrete fixes.
+    
+    The critique is streamed and can be cut short once the verdict is known,
+    when the caller won't act on the strengths/issues that follow it.
+    
+    Args:
+        story: Generated story text
+        request: Original user request
+        category_info: Output from categorizer
+        feedback: "always" reads the full critique; "on_revise" stops after an
+            ACCEPT verdict; "never" stops after the verdict either way
+        
+    Returns:
+        {
+            "scores": {...},
+            "overall_score": 7.8,
+            "verdict": "ACCEPT" | "REVISE",
+            "strengths": ["...", "..."],
+            "issues": [
+                {
+                    "location": "paragraph 2",
+                    "problem": "Dragon's fear is stated but never explained",
+                    "fix": "Add one sentence showing WHY dragon fears dark",
+                    "severity": "moderate"
+                }
+            ]
+        }
+        
+    API Calls: 1
+    Temperature: 0.2 (analytical)
+    """
+    logger.info("TIER 2: Structured critique of story...")
+    
+    prompt = PROMPT_STORY_JUDGE.format_map({
+        "request": request,
+        "category": category_info.category,
+        "themes": category_info.themes_text,
+        "story": story
+    })
 
     try:
         if not client:
-            raise Exception("OpenAI client not initialized. Please set OPENAI_API_KEY environment variable.")
+            raise Exception(API_KEY_MISSING_MSG)
+        
+        def verdict_is_enough(partial):
+            if feedback == "always" or not fields_complete(partial, "overall_score", "verdict"):
+                return False
+            return feedback == "never" or partial["verdict"] == "ACCEPT"
         
-        response = client.chat.completions.create(
+        judge_result = await stream_json_completion(
+            verdict_is_enough,
             model=MODEL,
-            messages=[{"role": "user", "content": prompt}],
+            messages=chat_messages(SYSTEM_STORY_JUDGE, prompt),
             temperature=0.2,
-            max_tokens=800
+            max_tokens=600,
+            response_format={"type": "json_object"}
         )
-        
-        judge_result = json.loads(response.choices[0].message.content)
+        if verdict_is_enough(judge_result):
+            # Drop the half-streamed lists rather than report partial feedback
+            judge_result["strengths"] = []
+            judge_result["issues"] = []
+        judge_result = normalize_judgment(judge_result)
         verdict = judge_result["verdict"]
         score = judge_result["overall_score"]
-        issues_count = len(judge_result.get("issues", []))
+        issues_count = len(judge_result["issues"])
         
-        logger.info(f"✅ Structured critique complete. Verdict: {verdict} (Score: {score:.1f})")
-        if issues_count > 0:
-            logger.info(f"   Issues found: {issues_count}")
-            for issue in judge_result.get("issues", []):
-                logger.info(f"   - [{issue['severity']}] {issue['location']}: {issue['problem']}")
+        logger.info("Structured critique complete. Verdict: %s (Score: %.1f)", verdict, score)
+        if issues_count > 0 and logger.isEnabledFor(logging.INFO):
+            logger.info("   Issues found: %s", issues_count)
+            for issue in judge_result["issues"]:
+                logger.info("   - [%s] %s: %s", issue['severity'], issue['location'], issue['problem'])
         
         return judge_result
         
     except Exception as e:
-        logger.error(f"Error in structured story evaluation: {e}")
+        logger.error("Error in structured story evaluation: %s", e)
         # Fallback judgment
         return {
             "scores": {"age_appropriateness": 8, "engagement": 7, "structure": 8, "educational_value": 7, "bedtime_suitability": 8},
@@ -535,7 +1606,258 @@ Acceptance criteria: Overall score >= 7.5 = "ACCEPT", < 7.5 = "REVISE"
             "issues": []
         }
 
-def refine_story_v2(story: str, judge_feedback: Dict, request: str) -> str:
+# Story judging split across a panel of narrower judges that run concurrently:
+# aspect -> the judge_story_v2 score dimensions that judge is responsible for
+JUDGE_PANEL = {
+    "narrative": {
+        "engagement": "How interesting and captivating the story is",
+        "structure": "Clear beginning, middle, end with good flow"
+    },
+    "language": {
+        "age_appropriateness": "Vocabulary and content suitable for ages 5-10"
+    },
+    "bedtime values": {
+        "educational_value": "Positive lessons or values taught",
+        "bedtime_suitability": "Calming and appropriate for bedtime"
+    }
+}
+
+SYSTEM_PANEL_JUDGE = """
+You are an expert children's literature editor on a review panel. Judge ONLY the
+{aspect} of the story with SPECIFIC, ACTIONABLE feedback; other editors cover the rest.
+
+Provide scores (1-10) for:
+{criteria}
+
+For any score below 8, identify SPECIFIC issues:
+- WHERE in the story (which paragraph/section: "opening", "middle section", "paragraph 2", "ending")
+- WHAT is the problem (be concrete and specific)
+- HOW to fix it (actionable suggestion with example)
+- SEVERITY (critical/moderate/minor)
+
+Also list the story's strengths in this area to preserve during revision.
+
+Return a JSON object:
+{{
+    "scores": {{{score_keys}}},
+    "strengths": ["..."],
+    "issues": [
+        {{"location": "opening paragraph", "problem": "...", "fix": "...", "severity": "moderate"}}
+    ]
+}}
+"""
+SYSTEM_PANEL_JUDGES = {
+    aspect: SYSTEM_PANEL_JUDGE.format(
+        aspect=aspect,
+        criteria="\n".join(f"- {name}: {description}" for name, description in criteria.items()),
+        score_keys=", ".join(f'"{name}": 8' for name in criteria)
+    )
+    for aspect, criteria in JUDGE_PANEL.items()
+}
+
+async def judge_story_panel(story: str, request: str, category_info: CategoryInfo) -> Dict:
+    """
+    Judge a story with the JUDGE_PANEL judges running concurrently.
+    
+    Each judge scores only its own dimensions, so its answer is a fraction of
+    a full critique and the panel finishes in about the time of the slowest
+    judge rather than one long critique. Scores, strengths and issues are
+    merged into one judge_story_v2-shaped result; if every judge fails, a
+    single full judge_story_v2 call is used instead.
+    
+    Returns:
+        Same structure as judge_story_v2 (always with full feedback)
+        
+    API Calls: len(JUDGE_PANEL) (concurrent)
+    Temperature: 0.2 (analytical)
+    """
+    logger.info("TIER 2: Panel critique of story (%s judges)...", len(JUDGE_PANEL))
+    
+    prompt = PROMPT_STORY_JUDGE.format_map({
+        "request": request,
+        "category": category_info.category,
+        "themes": category_info.themes_text,
+        "story": story
+    })
+    
+    async def judge_aspect(aspect: str) -> Dict:
+        try:
+            if not client:
+                raise Exception(API_KEY_MISSING_MSG)
+            
+            result = await json_chat_completion(
+                model=MODEL,
+                messages=chat_messages(SYSTEM_PANEL_JUDGES[aspect], prompt),
+                temperature=0.2,
+                max_tokens=300,
+                response_format={"type": "json_object"}
+            )
+            # Keep only the dimensions this judge owns
+            result["scores"] = {name: result["scores"][name] for name in JUDGE_PANEL[aspect]}
+            return normalize_judgment(result)
+        except Exception as e:
+            logger.error("Error in %s judge: %s", aspect, e)
+            return None
+    
+    verdicts = [v for v in await asyncio.gather(*[judge_aspect(aspect) for aspect in JUDGE_PANEL]) if v]
+    if not verdicts:
+        return await judge_story_v2(story, request, category_info)
+    
+    scores = {name: score for verdict in verdicts for name, score in verdict["scores"].items()}
+    overall_score = round(sum(scores.values()) / len(scores), 1)
+    judge_result = {
+        "scores": scores,
+        "overall_score": overall_score,
+        "verdict": "ACCEPT" if overall_score >= ACCEPT_SCORE else "REVISE",
+        "strengths": [strength for verdict in verdicts for strength in verdict["strengths"]],
+        "issues": [issue for verdict in verdicts for issue in verdict["issues"]]
+    }
+    logger.info("Panel critique complete. Verdict: %s (Score: %.1f), issues found: %s",
+                judge_result["verdict"], overall_score, len(judge_result["issues"]))
+    return judge_result
+
+SYSTEM_STORY_BATCH_JUDGE = SYSTEM_STORY_JUDGE + """
+You will be given several numbered stories. Evaluate each one on its own and
+return a JSON object {"judgments": [...]} holding one evaluation, shaped like the
+example above, per story in the order given.
+"""
+
+PROMPT_STORY_BATCH_ENTRY = """
+STORY {index}
+Original request: "{request}"
+Target category: {category}
+Target themes: {themes}
+
+{story}
+"""
+
+# Stories graded per judge_stories_batch call; larger groups amortize the
+# judge instructions further but risk truncating the last judgments
+JUDGE_BATCH_SIZE = 4
+
+async def judge_stories_batch(stories: List[Tuple[str, str, CategoryInfo]]) -> List[Dict]:
+    """
+    Judge many stories, several per API call.
+    
+    The judge instructions are sent once per group of JUDGE_BATCH_SIZE stories
+    instead of once per story, and the groups are judged concurrently. Stories
+    whose judgment is missing from a group's answer (e.g. cut off by
+    max_tokens) are judged one by one with judge_story_v2.
+    
+    Args:
+        stories: (story, request, category_info) tuples
+        
+    Returns:
+        One judge_story_v2-shaped judgment per story, in order
+        
+    API Calls: ceil(len(stories) / JUDGE_BATCH_SIZE) (concurrent), plus one
+    per story that needed a retry
+    """
+    async def judge_group(group: List[Tuple[str, str, CategoryInfo]]) -> List[Dict]:
+        prompt = "".join(
+            PROMPT_STORY_BATCH_ENTRY.format_map({
+                "index": i,
+                "request": request,
+                "category": category_info.category,
+                "themes": category_info.themes_text,
+                "story": story
+            })
+            for i, (story, request, category_info) in enumerate(group, 1)
+        )
+        judgments = []
+        try:
+            if not client:
+                raise Exception(API_KEY_MISSING_MSG)
+            
+            result = await json_chat_completion(
+                model=MODEL,
+                messages=chat_messages(SYSTEM_STORY_BATCH_JUDGE, prompt),
+                temperature=0.2,
+                max_tokens=600 * len(group),
+                response_format={"type": "json_object"}
+            )
+            # Judgments are matched to stories by position, so stop at the first unusable one
+            for judgment in result["judgments"][:len(group)]:
+                judgments.append(normalize_judgment(judgment))
+        except Exception as e:
+            logger.error("Error in batched story evaluation: %s", e)
+        
+        if len(judgments) < len(group):
+            logger.warning("Batched judge returned %s/%s judgments; judging the rest one by one", len(judgments), len(group))
+            judgments += await asyncio.gather(*[
+                judge_story_v2(story, request, category_info) for story, request, category_info in group[len(judgments):]
+            ])
+        return judgments[:len(group)]
+    
+    logger.info("Judging %s stories in groups of %s...", len(stories), JUDGE_BATCH_SIZE)
+    groups = [stories[i:i + JUDGE_BATCH_SIZE] for i in range(0, len(stories), JUDGE_BATCH_SIZE)]
+    results = await asyncio.gather(*[judge_group(group) for group in groups])
+    return [judgment for group_judgments in results for judgment in group_judgments]
+
+# A REVISE verdict at or above this score with only minor issues (at most one
+# moderate, none critical) isn't worth a refine + re-judge round-trip
+MARGINAL_REVISE_SCORE = 7.2
+
+def refinement_worthwhile(judge_result: Dict) -> bool:
+    """
+    Decide whether a REVISE verdict justifies refining the story.
+    
+    Returns:
+        False if the story is just under the acceptance bar and its issues are
+        minor, so refinement would cost two API calls for a marginal gain
+    """
+    severities = [issue["severity"] for issue in judge_result["issues"]]
+    return not (severities.count("critical") == 0
+                and severities.count("moderate") <= 1
+                and judge_result["overall_score"] >= MARGINAL_REVISE_SCORE)
+
+# Best mode stops refining once a re-judged story scores this high, or once
+# its remaining issues are too minor to be worth refining (see
+# refinement_worthwhile)
+CONVERGED_SCORE = 8.5
+
+def refinement_converged(judge_result: Dict) -> bool:
+    """
+    Decide whether another refinement cycle can be skipped.
+    
+    Returns:
+        True if the story is accepted, scores at least CONVERGED_SCORE, has no
+        issues left, or is only marginally short with minor issues (see
+        refinement_worthwhile)
+    """
+    return (judge_result["verdict"] == "ACCEPT"
+            or judge_result["overall_score"] >= CONVERGED_SCORE
+            or not judge_result["issues"]
+            or not refinement_worthwhile(judge_result))
+
+SYSTEM_REFINER = """
+You are a best selling children's story author and editor making targeted revisions. Address each specific issue while preserving the story's strengths. You are writing for ages 5-10.
+
+Instructions:
+1. Address each issue exactly as specified
+2. Make MINIMAL changes - only what's needed for each fix
+3. Preserve all strengths and good parts
+4. Keep the overall structure, tone, and flow
+5. Do not rewrite sections that aren't mentioned in issues
+6. Maintain the same story length (300-500 words)
+
+Return the revised story with targeted improvements.
+"""
+
+PROMPT_REFINER = """
+Specific issues to fix:
+{issues}
+
+Story strengths to preserve:
+{strengths}
+
+Original story:
+{story}
+"""
+# One line per issue keeps the refinement prompt short
+PROMPT_ISSUE = "[{index}][{severity}] {location}: {problem} -> {fix}"
+
+async def refine_story_v2(story: str, judge_feedback: Dict, request: str) -> str:
     """
     Refine story by addressing specific issues.
     
@@ -553,103 +1875,130 @@ def refine_story_v2(story: str, judge_feedback: Dict, request: str) -> str:
     API Calls: 1
     Temperature: 0.6 (balanced refinement)
     """
-    logger.info("🔧 TIER 2: Targeted refinement based on structured feedback...")
+    logger.info("TIER 2: Targeted refinement based on structured feedback...")
     
-    issues = judge_feedback.get("issues", [])
-    strengths = judge_feedback.get("strengths", [])
+    issues = judge_feedback["issues"]
+    strengths = judge_feedback["strengths"]
     
     if not issues:
-        logger.info("✅ No issues to fix - story is already good!")
+        logger.info("No issues to fix - story is already good!")
         return story
     
-    # Format issues for the prompt
-    issues_text = format_issues_list(issues)
-    
-    prompt = f"""
-You are a best selling children's story author and editor making targeted revisions. Address each specific issue while preserving the story's strengths. You are writing for ages 5-10.
-
-Original story:
-{story}
-
-Specific issues to fix:
-{issues_text}
-
-Story strengths to preserve:
-{', '.join(strengths)}
-
-Instructions:
-1. Address each issue exactly as specified
-2. Make MINIMAL changes - only what's needed for each fix
-3. Preserve all strengths and good parts
-4. Keep the overall structure, tone, and flow
-5. Do not rewrite sections that aren't mentioned in issues
-6. Maintain the same story length (300-500 words)
-
-Return the revised story with targeted improvements.
-"""
+    prompt = PROMPT_REFINER.format_map({
+        "issues": "\n".join(
+            PROMPT_ISSUE.format_map({**issue, "index": i, "severity": issue["severity"].upper()})
+            for i, issue in enumerate(issues, 1)
+        ),
+        "strengths": ", ".join(strengths),
+        "story": story
+    })
 
     try:
         if not client:
-            raise Exception("OpenAI client not initialized. Please set OPENAI_API_KEY environment variable.")
+            raise Exception(API_KEY_MISSING_MSG)
         
-        response = client.chat.completions.create(
+        response = await chat_completion(
             model=MODEL,
-            messages=[{"role": "user", "content": prompt}],
+            messages=chat_messages(SYSTEM_REFINER, prompt),
             temperature=0.6,
-            max_tokens=800
+            max_tokens=700
         )
         
         refined_story = response.choices[0].message.content.strip()
-        logger.info(f"Story refined ({len(refined_story)} characters)")
-        logger.info(f"Fixed {len(issues)} specific issues")
+        logger.info("Story refined (%s characters)", len(refined_story))
+        logger.info("Fixed %s specific issues", len(issues))
         return refined_story
         
     except Exception as e:
-        logger.error(f"Error refining story: {e}")
+        logger.error("Error refining story: %s", e)
         return story  # Return original if refinement fails
 
-# ============= STORY GENERATION =============
+SYSTEM_CRITIQUE_AND_REWRITE = SYSTEM_STORY_JUDGE + """
+Then, in the same JSON object and after "issues", add "revised_story": the
+complete story rewritten to fix each issue. Make MINIMAL changes, preserve the
+strengths, and keep the structure, tone and length (300-500 words).
+Set "revised_story" to "" if the verdict is ACCEPT, the overall score is
+{converged_score} or higher, there are no issues, or the overall score is
+{marginal_score} or higher with no critical and at most one moderate issue.
+""".format(converged_score=CONVERGED_SCORE, marginal_score=MARGINAL_REVISE_SCORE)
 
-def generate_story(request: str, plan: Dict, category_info: Dict[str, Any]) -> str:
+async def judge_and_refine(story: str, request: str, category_info: CategoryInfo) -> Tuple[str, Dict]:
     """
-    Generate complete story from the best plan.
+    Critique a story and rewrite it in the same call.
+    
+    The critique comes first in the answer, so once it shows the story has
+    converged (see refinement_converged) the stream is closed before any
+    rewrite is generated. Otherwise the rewrite follows the issues it fixes,
+    saving the separate refine_story_v2 round-trip and a second pass over the
+    story's tokens. If the combined call fails, it falls back to
+    judge_story_v2 followed by refine_story_v2.
+    
+    The one call has one temperature, the critique's 0.2, so the rewrite
+    samples cooler than refine_story_v2 (0.6). That suits its minimal-change
+    fixes, but since the answer carries a rewritten story it always bypasses
+    the completion cache like the other refinements.
     
-    Args:
-        request: Original user request
-        plan: Best plan selected by judge_plans
-        category_info: Output from categorizer
-        
     Returns:
-        Complete bedtime story (300-500 words)
+        (story, judge_result): the rewritten story (or the original if it has
+        converged), and the judge_story_v2-shaped critique of the original
         
-    API Calls: 1
-    Temperature: 0.8 (creative)
+    API Calls: 1 (2 on fallback)
+    Temperature: 0.2 (analytical critique; minimal-change rewrite)
     """
-    logger.info("Generating complete story from best plan...")
+    logger.info("TIER 2: Critique and rewrite in one call...")
     
-    category = category_info["category"]
-    themes = ", ".join(category_info["themes"])
-    tone = category_info["tone"]
-    approach = plan["approach"]
-    plan_text = plan["plan_text"]
+    prompt = PROMPT_STORY_JUDGE.format_map({
+        "request": request,
+        "category": category_info.category,
+        "themes": category_info.themes_text,
+        "story": story
+    })
     
-    # Generate unique character names
-    character_names = generate_unique_character_names(request, category_info, 3)
-    names_list = ", ".join(character_names)
+    def critique_is_enough(partial):
+        return (fields_complete(partial, "overall_score", "verdict", "issues")
+                and refinement_converged(normalize_judgment(partial)))
     
-    prompt = f"""
+    try:
+        if not client:
+            raise Exception(API_KEY_MISSING_MSG)
+        
+        # A rewrite cut off by max_tokens is dropped and redone by refine_story_v2
+        result = await stream_json_completion(
+            critique_is_enough,
+            drop_if_truncated=("revised_story",),
+            cache=False,
+            model=MODEL,
+            messages=chat_messages(SYSTEM_CRITIQUE_AND_REWRITE, prompt),
+            temperature=0.2,
+            max_tokens=1300,
+            response_format={"type": "json_object"}
+        )
+        judge_result = normalize_judgment(result)
+        revised_story = str(result.get("revised_story") or "").strip()
+    except Exception as e:
+        logger.error("Error in combined critique and rewrite: %s", e)
+        judge_result = await judge_story_v2(story, request, category_info, feedback="on_revise")
+        if refinement_converged(judge_result):
+            return story, judge_result
+        return await refine_story_v2(story, judge_result, request), judge_result
+    
+    logger.info("Critique complete. Verdict: %s (Score: %.1f), issues found: %s",
+                judge_result["verdict"], judge_result["overall_score"], len(judge_result["issues"]))
+    if refinement_converged(judge_result) or not judge_result["issues"]:
+        return story, judge_result
+    if not revised_story:
+        # Critiqued but not rewritten (or the rewrite was cut off by max_tokens)
+        return await refine_story_v2(story, judge_result, request), judge_result
+    logger.info("Story rewritten (%s characters)", len(revised_story))
+    return revised_story, judge_result
+
+# ============= STORY GENERATION =============
+
+SYSTEM_STORY_AUTHOR = """
 You are a beloved children's bedtime story author writing for ages 5-10.
 Write a complete bedtime story based on the provided plan.
 
-User Request: "{request}"
-Story Plan: "{plan_text}"
-Approach: {approach}
-Category: {category}
-Themes: {themes}
-Tone: {tone}
-
-CHARACTER NAMES TO USE: {names_list}
-Use these unique character names in your story. Do not use any other names.
+Use the given character names in your story. Do not use any other names.
 
 Write a complete story (300-500 words) with:
 
@@ -676,62 +2025,80 @@ STRUCTURE:
 Respond with ONLY the story text, no additional commentary.
 """
 
-    try:
-        if not client:
-            raise Exception("OpenAI client not initialized. Please set OPENAI_API_KEY environment variable.")
-        
-        response = client.chat.completions.create(
-            model=MODEL,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.8,
-            max_tokens=800
-        )
-        
-        story = response.choices[0].message.content.strip()
-        logger.info(f"Story generated ({len(story)} characters)")
-        return story
-        
-    except Exception as e:
-        logger.error(f"Error generating story: {e}")
-        return "I'm sorry, I couldn't generate the story right now. Please try again."
+PROMPT_STORY_AUTHOR = """
+CHARACTER NAMES TO USE: {names}
+
+Approach: {approach}
+Category: {category}
+Themes: {themes}
+Tone: {tone}
+Story Plan: "{plan_text}"
+User Request: "{request}"
+"""
 
-def generate_story_with_strong_constraints(request: str, category_info: Dict[str, Any]) -> str:
+# Returned in place of a story whenever story writing fails
+FALLBACK_STORY = "I'm sorry, I couldn't generate the story right now. Please try again."
+
+async def generate_story(request: str, plan: Plan, category_info: CategoryInfo, character_names: List[str] = None,
+                         on_token: Callable[[str], None] = None) -> str:
     """
-    Generate story with extra constraints for fast mode.
-    
-    Includes harder requirements to get it right first time without judging.
-    This is used in FAST mode to skip the judging/refinement pipeline.
+    Generate complete story from the best plan.
     
     Args:
         request: Original user request
+        plan: Best plan selected by judge_plans
         category_info: Output from categorizer
+        character_names: Names to use (generated here if not provided)
+        on_token: If given, the story is streamed and each text delta is passed to it
         
     Returns:
         Complete bedtime story (300-500 words)
         
     API Calls: 1
-    Temperature: 0.7 (slightly more constrained)
+    Temperature: 0.8 (creative)
     """
-    logger.info("Generating story with strong constraints for fast mode...")
-    
-    category = category_info["category"]
-    themes = ", ".join(category_info["themes"])
+    logger.info("Generating complete story from best plan...")
     
     # Generate unique character names
-    character_names = generate_unique_character_names(request, category_info, 3)
-    names_list = ", ".join(character_names)
-    tone = category_info["tone"]
+    if character_names is None:
+        character_names = await generate_unique_character_names(request, category_info, 3)
     
-    prompt = f"""
-You are a critically-acclaimed children's bedtime story author. Write a BEST-SELLING story on the first try.
+    prompt = PROMPT_STORY_AUTHOR.format_map({
+        "names": ", ".join(character_names),
+        "approach": plan.approach,
+        "category": category_info.category,
+        "themes": category_info.themes_text,
+        "tone": category_info.tone,
+        "plan_text": plan.plan_text,
+        "request": request
+    })
 
-User Request: "{request}"
-Category: {category}
-Themes: {themes}
-Tone: {tone}
+    try:
+        if not client:
+            raise Exception(API_KEY_MISSING_MSG)
+        
+        request_kwargs = dict(
+            model=MODEL,
+            messages=chat_messages(SYSTEM_STORY_AUTHOR, prompt),
+            temperature=0.8,
+            max_tokens=700
+        )
+        if on_token:
+            story = (await stream_chat_completion(on_token, **request_kwargs)).strip()
+        else:
+            response = await chat_completion(**request_kwargs)
+            story = response.choices[0].message.content.strip()
+        logger.info("Story generated (%s characters)", len(story))
+        return story
+        
+    except Exception as e:
+        logger.error("Error generating story: %s", e)
+        return FALLBACK_STORY
+
+SYSTEM_ONE_SHOT_AUTHOR = """
+You are a critically-acclaimed children's bedtime story author. Write a BEST-SELLING story on the first try.
 
-CHARACTER NAMES TO USE: {names_list}
-Use these unique character names in your story. Do not use any other names.
+Use the given character names in your story. Do not use any other names.
 
 Write a complete story (300-500 words) that MUST be:
 
@@ -764,28 +2131,106 @@ This story will NOT be judged or refined, so it must be excellent on the first t
 Respond with ONLY the story text, no additional commentary.
 """
 
+PROMPT_ONE_SHOT_AUTHOR = """
+CHARACTER NAMES TO USE: {names}
+
+Category: {category}
+Themes: {themes}
+Tone: {tone}
+User Request: "{request}"
+"""
+
+def build_strong_constraints_prompt(request: str, category_info: CategoryInfo, character_names: List[str]) -> str:
+    """
+    Build the user message (for SYSTEM_ONE_SHOT_AUTHOR) used when the story will not be judged or refined.
+    
+    Shared by fast mode and the Batch API path.
+    """
+    return PROMPT_ONE_SHOT_AUTHOR.format_map({
+        "names": ", ".join(character_names),
+        "category": category_info.category,
+        "themes": category_info.themes_text,
+        "tone": category_info.tone,
+        "request": request
+    })
+
+async def generate_story_with_strong_constraints(request: str, category_info: CategoryInfo,
+                                                on_token: Callable[[str], None] = None) -> str:
+    """
+    Generate story with extra constraints for fast mode.
+    
+    Includes harder requirements to get it right first time without judging.
+    This is used in FAST mode to skip the judging/refinement pipeline.
+    
+    Args:
+        request: Original user request
+        category_info: Output from categorizer
+        on_token: If given, the story is streamed and each text delta is passed to it
+        
+    Returns:
+        Complete bedtime story (300-500 words)
+        
+    API Calls: 1
+    Temperature: 0.7 (slightly more constrained)
+    """
+    logger.info("Generating story with strong constraints for fast mode...")
+    
+    # Generate unique character names
+    character_names = await generate_unique_character_names(request, category_info, 3)
+    prompt = build_strong_constraints_prompt(request, category_info, character_names)
+
     try:
         if not client:
-            raise Exception("OpenAI client not initialized. Please set OPENAI_API_KEY environment variable.")
+            raise Exception(API_KEY_MISSING_MSG)
         
-        response = client.chat.completions.create(
+        request_kwargs = dict(
             model=MODEL,
-        messages=[{"role": "user", "content": prompt}],
+            messages=chat_messages(SYSTEM_ONE_SHOT_AUTHOR, prompt),
             temperature=0.7,
-            max_tokens=800
+            max_tokens=700
         )
-        
-        story = response.choices[0].message.content.strip()
-        logger.info(f"✅ Fast-mode story generated ({len(story)} characters)")
+        if on_token:
+            story = (await stream_chat_completion(on_token, **request_kwargs)).strip()
+        else:
+            response = await chat_completion(**request_kwargs)
+            story = response.choices[0].message.content.strip()
+        logger.info("Fast-mode story generated (%s characters)", len(story))
         return story
         
     except Exception as e:
-        logger.error(f"❌ Error generating fast-mode story: {e}")
-        return "I'm sorry, I couldn't generate the story right now. Please try again."
+        logger.error("Error generating fast-mode story: %s", e)
+        return FALLBACK_STORY
 
 # ============= ADAPTIVE MODES =============
 
-def generate_bedtime_story_fast(request: str) -> Dict:
+async def plan_and_name_characters(request: str, category_info: CategoryInfo, plans: List[Plan] = None):
+    """
+    Run multi-plan selection and character naming concurrently.
+    
+    The LLM plan judge is skipped when pick_plan_locally can already tell
+    which plan to use.
+    
+    Both only depend on the categorization, so their OpenAI round-trips overlap
+    instead of adding up.
+    
+    Args:
+        plans: Plans already drafted (e.g. by categorize_and_plan); generated here if None
+    
+    Returns:
+        (plan_judge_result, character_names)
+    """
+    async def select_best_plan():
+        candidates = plans or await create_multiple_plans(request, category_info, num_plans=3)
+        return (pick_plan_locally(candidates, category_info)
+                or await judge_plans(candidates, request, category_info))
+    
+    plan_judge_result, character_names = await asyncio.gather(
+        select_best_plan(),
+        generate_unique_character_names(request, category_info, 3)
+    )
+    return plan_judge_result, character_names
+
+async def generate_bedtime_story_fast(request: str, on_token: Callable[[str], None] = None) -> Dict:
     """
     FAST MODE: Categorize → Generate with strong constraints → Done
     
@@ -797,24 +2242,25 @@ def generate_bedtime_story_fast(request: str) -> Dict:
     
     API calls: 2
     """
-    logger.info("🚀 FAST MODE: Quick story generation with strong constraints")
+    logger.info("FAST MODE: Quick story generation with strong constraints")
+    api_calls = start_api_call_count()
     
     try:
         # Stage 1: Categorize
-        category_info = categorize_story_request(request)
+        category_info = await categorize_story_request(request)
         
         # Stage 2: Generate with strong constraints (no judging needed)
-        story = generate_story_with_strong_constraints(request, category_info)
+        story = await generate_story_with_strong_constraints(request, category_info, on_token)
         
         # Prepare result
         result = {
             "story": story,
-            "category": category_info["category"],
-            "themes": category_info["themes"],
-            "tone": category_info["tone"],
+            "category": category_info.category,
+            "themes": list(category_info.themes),
+            "tone": category_info.tone,
             "mode": "fast",
             "final_score": "N/A (not evaluated)",
-            "api_calls": 2,
+            "api_calls": api_calls[0],
             "iterations": 1,
             "estimated_quality": "7-8/10",
             "metadata": {
@@ -823,91 +2269,101 @@ def generate_bedtime_story_fast(request: str) -> Dict:
             }
         }
         
-        logger.info(f"🎉 Fast mode complete! API calls: {result['api_calls']}")
+        logger.info("Fast mode complete! API calls: %s", result['api_calls'])
         return result
         
     except Exception as e:
-        logger.error(f"Error in fast mode: {e}")
-        return {
-            "story": "I'm sorry, there was an error generating your story. Please try again.",
-            "mode": "fast",
-            "api_calls": 0,
-            "iterations": 0,
-            "metadata": {"error": str(e)}
-        }
+        logger.exception("Error in fast mode: %s", e)
+        raise StoryGenError("generation_failed", "There was an error generating your story. Please try again.", 502) from e
 
-def generate_bedtime_story_balanced(request: str) -> Dict:
+async def generate_bedtime_story_balanced(request: str, on_token: Callable[[str], None] = None) -> Dict:
     """
     BALANCED MODE: Full pipeline with conditional refinement
     
+    Categorization and planning share one call (categorize_and_plan). A story
+    that narrowly misses the bar with only minor issues is kept as drafted
+    (see refinement_worthwhile).
+    
     Perfect for:
     - Default mode for most users
     - Typical story requests
     - Good quality without excessive cost
     
-    API calls: 5-6
+    API calls: 3-6
     Time: 12-15 seconds
     Quality: 8-9/10
     """
-    logger.info("⚖️ BALANCED MODE: Full pipeline with conditional refinement")
+    logger.info("BALANCED MODE: Full pipeline with conditional refinement")
+    api_calls = start_api_call_count()
     
     try:
-        # Stage 1: Categorize
-        category_info = categorize_story_request(request)
+        # Stage 1: Categorize and draft plans in one call
+        category_info, plans = await categorize_and_plan(request)
         
-        # Stage 2: Multi-plan selection
-        plans = create_multiple_plans(request, category_info, num_plans=3)
-        plan_judge_result = judge_plans(plans, request, category_info)
+        # Stage 2: Plan selection (concurrently with character naming)
+        plan_judge_result, character_names = await plan_and_name_characters(request, category_info, plans)
         best_plan = plan_judge_result["best_plan"]
         
         # Stage 3: Generate story
-        story = generate_story(request, best_plan, category_info)
+        story = await generate_story(request, best_plan, category_info, character_names, on_token)
         
         # Stage 4: Judge and conditionally refine
-        judge_result = judge_story_v2(story, request, category_info)
+        judge_result = await judge_story_v2(story, request, category_info, feedback="on_revise")
         
         iterations = 1
-        if judge_result["verdict"] == "REVISE":
-            logger.info("🔄 Story needs improvement - refining...")
-            story = refine_story_v2(story, judge_result, request)
-            judge_result = judge_story_v2(story, request, category_info)
+        issues_fixed = 0
+        refinement_skipped = judge_result["verdict"] == "REVISE" and not refinement_worthwhile(judge_result)
+        if refinement_skipped:
+            logger.info("Score %.1f with only minor issues - keeping the draft", judge_result['overall_score'])
+        elif judge_result["verdict"] == "REVISE":
+            logger.info("Story needs improvement - refining...")
+            story = await refine_story_v2(story, judge_result, request)
+            issues_fixed = len(judge_result["issues"])
+            judge_result = await judge_story_v2(story, request, category_info, feedback="never")
             iterations = 2
         
         # Prepare result
         result = {
             "story": story,
-            "category": category_info["category"],
-            "themes": category_info["themes"],
-            "tone": category_info["tone"],
+            "category": category_info.category,
+            "themes": list(category_info.themes),
+            "tone": category_info.tone,
             "mode": "balanced",
             "final_score": judge_result["overall_score"],
-            "api_calls": 5 + (iterations - 1),  # Base 5 + refinement calls
+            "api_calls": api_calls[0],
             "iterations": iterations,
             "estimated_quality": "8-9/10",
             "metadata": {
-                "plan_approach": best_plan["approach"],
+                "plan_approach": best_plan.approach,
                 "plan_reasoning": plan_judge_result["reasoning"],
                 "judge_verdict": judge_result["verdict"],
-                "issues_fixed": len(judge_result.get("issues", []))
+                "issues_fixed": issues_fixed,
+                "refinement_skipped": refinement_skipped
             }
         }
         
-        logger.info(f"🎉 Balanced mode complete! Final score: {result['final_score']:.1f}, API calls: {result['api_calls']}")
+        logger.info("Balanced mode complete! Final score: %.1f, API calls: %s", result['final_score'], result['api_calls'])
         return result
         
     except Exception as e:
-        logger.error(f"Error in balanced mode: {e}")
-        return {
-            "story": "I'm sorry, there was an error generating your story. Please try again.",
-            "mode": "balanced",
-            "api_calls": 0,
-            "iterations": 0,
-            "metadata": {"error": str(e)}
-        }
+        logger.exception("Error in balanced mode: %s", e)
+        raise StoryGenError("generation_failed", "There was an error generating your story. Please try again.", 502) from e
 
-def generate_bedtime_story_best(request: str) -> Dict:
+async def generate_bedtime_story_best(request: str, on_token: Callable[[str], None] = None,
+                                      run_id: str = None) -> Dict:
     """
-    BEST MODE: Full pipeline with guaranteed 2 refinements
+    BEST MODE: Full pipeline with up to 2 refinements
+    
+    The first critique comes from the concurrent judge panel
+    (judge_story_panel); the second critiques and rewrites in one call
+    (judge_and_refine). Refinement stops early once the story has converged
+    (see refinement_converged), and the last critique doubles as the final
+    evaluation when the story hasn't changed since.
+    
+    Given a run_id, progress is checkpointed under it after each stage, so
+    rerunning an interrupted run with the same run_id picks up after its
+    last finished stage. Nothing is saved from a stage that fell back (or
+    after it), and the checkpoint is dropped once the run finishes.
     
     Perfect for:
     - Premium users
@@ -915,85 +2371,139 @@ def generate_bedtime_story_best(request: str) -> Dict:
     - Published content
     - Complex requests
     
-    API calls: 8-10
+    API calls: 6-11
     """
-    logger.info("BEST MODE: Full pipeline with guaranteed refinements")
+    logger.info("BEST MODE: Full pipeline with up to 2 refinements")
+    api_calls = start_api_call_count()
+    ckpt_key = checkpoint_key(run_id) if run_id else None
+    checkpoint = await checkpoint_load(ckpt_key) if ckpt_key else {}
+    if checkpoint.get("request", request) != request:
+        logger.warning("Checkpoint for run %s is for a different request; starting over", run_id)
+        checkpoint = {}
+    if checkpoint:
+        logger.info("Resuming run %s (%s refinement cycles done)", run_id, checkpoint.get("cycle", 0))
+    checkpoint["request"] = request
+    
+    async def record(fell_back: bool, **outputs):
+        # Outputs are always kept for this run, but once a stage has fallen
+        # back nothing more is persisted, so a resume never builds on it
+        nonlocal ckpt_key
+        checkpoint.update(outputs)
+        if fell_back:
+            ckpt_key = None
+        if ckpt_key:
+            await checkpoint_save(ckpt_key, checkpoint)
     
     try:
-        # Stage 1: Categorize
-        category_info = categorize_story_request(request)
-        
-        # Stage 2: Multi-plan selection
-        plans = create_multiple_plans(request, category_info, num_plans=3)
-        plan_judge_result = judge_plans(plans, request, category_info)
-        best_plan = plan_judge_result["best_plan"]
+        if "best_plan" in checkpoint:
+            category_info = CategoryInfo.from_dict(checkpoint["category_info"])
+            best_plan = Plan(**checkpoint["best_plan"])
+        else:
+            # Stage 1: Categorize, drafting the plans concurrently (they only need the request)
+            category_info, plans = await asyncio.gather(
+                categorize_story_request(request),
+                create_multiple_plans(request)
+            )
+            
+            # Stage 2: Plan selection (concurrently with character naming)
+            plan_judge_result, character_names = await plan_and_name_characters(request, category_info, plans)
+            best_plan = plan_judge_result["best_plan"]
+            fell_back = (category_info == FALLBACK_CATEGORY_INFO or best_plan == FALLBACK_PLAN
+                         or plan_judge_result["reasoning"] == FALLBACK_PLAN_REASONING)
+            await record(fell_back, category_info=asdict(category_info), best_plan=asdict(best_plan),
+                         plan_reasoning=plan_judge_result["reasoning"], character_names=character_names)
         
         # Stage 3: Generate story
-        story = generate_story(request, best_plan, category_info)
+        if "story" in checkpoint:
+            story = checkpoint["story"]
+            if on_token:
+                on_token(story)
+        else:
+            story = await generate_story(request, best_plan, category_info, checkpoint["character_names"], on_token)
+            await record(story == FALLBACK_STORY, story=story)
         
-        # Stage 4: Guaranteed 2 refinement cycles
-        total_issues_fixed = 0
+        # Stage 4: Up to 2 refinement cycles
+        total_issues_fixed = checkpoint.get("total_issues_fixed", 0)
+        refinements = checkpoint.get("refinements", 0)
+        judged_current_story = False
         
-        for iteration in range(2):
-            logger.info(f"🔄 Refinement cycle {iteration + 1}/2...")
-            judge_result = judge_story_v2(story, request, category_info)
-            
-            if judge_result["verdict"] == "ACCEPT" and iteration > 0:
-                logger.info("Story meets quality standards, stopping refinement")
-                break
-            
-            issues = judge_result.get("issues", [])
-            if issues:
-                story = refine_story_v2(story, judge_result, request)
-                total_issues_fixed += len(issues)
-                logger.info(f"   Fixed {len(issues)} issues in cycle {iteration + 1}")
+        for iteration in range(checkpoint.get("cycle", 0), 2):
+            logger.info("Refinement cycle %s/2...", iteration + 1)
+            if iteration == 0:
+                # The first cycle always refines, so it needs the full critique
+                # even on ACCEPT; the panel returns it fastest
+                judge_result = await judge_story_panel(story, request, category_info)
+                if not judge_result["issues"]:
+                    logger.info("   No issues to fix in cycle %s", iteration + 1)
+                    judged_current_story = True
+                    break
+                refined_story = await refine_story_v2(story, judge_result, request)
+                # refine_story_v2 hands back the story unchanged when it fails
+                refine_failed = refined_story == story
+                story = refined_story
             else:
-                logger.info(f"   No issues to fix in cycle {iteration + 1}")
+                # Critique the revision and, unless it has converged, rewrite it in the same call
+                revised_story, judge_result = await judge_and_refine(story, request, category_info)
+                if revised_story == story:
+                    logger.info("Story meets quality standards (score %.1f), stopping refinement", judge_result['overall_score'])
+                    judged_current_story = True
+                    break
+                story = revised_story
+                refine_failed = False
+            
+            issues = judge_result["issues"]
+            refinements += 1
+            total_issues_fixed += len(issues)
+            logger.info("   Fixed %s issues in cycle %s", len(issues), iteration + 1)
+            await record(refine_failed, story=story, cycle=iteration + 1,
+                         refinements=refinements, total_issues_fixed=total_issues_fixed)
         
-        # Final evaluation
-        final_judge = judge_story_v2(story, request, category_info)
+        # Final evaluation, unless the last critique already covers this exact story
+        if judged_current_story:
+            final_judge = judge_result
+        else:
+            final_judge = await judge_story_v2(story, request, category_info, feedback="never")
         
         # Prepare result
         result = {
             "story": story,
-            "category": category_info["category"],
-            "themes": category_info["themes"],
-            "tone": category_info["tone"],
+            "category": category_info.category,
+            "themes": list(category_info.themes),
+            "tone": category_info.tone,
             "mode": "best",
             "final_score": final_judge["overall_score"],
-            "api_calls": 8,  # Base pipeline + 2 guaranteed refinements
-            "iterations": 3,  # Generate + 2 refinements
+            "api_calls": api_calls[0],
+            "iterations": 1 + refinements,
             "estimated_quality": "9-10/10",
             "metadata": {
-                "plan_approach": best_plan["approach"],
-                "plan_reasoning": plan_judge_result["reasoning"],
+                "plan_approach": best_plan.approach,
+                "plan_reasoning": checkpoint["plan_reasoning"],
                 "total_issues_fixed": total_issues_fixed,
                 "final_verdict": final_judge["verdict"]
             }
         }
         
-        logger.info(f"🎉 Best mode complete! Final score: {result['final_score']:.1f}, Issues fixed: {total_issues_fixed}")
+        if run_id:
+            await checkpoint_clear(checkpoint_key(run_id))
+        logger.info("Best mode complete! Final score: %.1f, Issues fixed: %s", result['final_score'], total_issues_fixed)
         return result
         
     except Exception as e:
-        logger.error(f"Error in best mode: {e}")
-        return {
-            "story": "I'm sorry, there was an error generating your story. Please try again.",
-            "mode": "best",
-            "api_calls": 0,
-            "iterations": 0,
-            "metadata": {"error": str(e)}
-        }
+        logger.exception("Error in best mode: %s", e)
+        raise StoryGenError("generation_failed", "There was an error generating your story. Please try again.", 502) from e
 
 # ============= MAIN ENTRY POINT =============
 
-def generate_bedtime_story(request: str, mode: str = "balanced") -> Dict:
+async def generate_bedtime_story(request: str, mode: str = "balanced", on_token: Callable[[str], None] = None,
+                                 run_id: str = None) -> Dict:
     """
     Main entry point with mode selection.
     
     Args:
         request: User's story request
         mode: "fast" | "balanced" | "best"
+        on_token: Optional callback receiving the first story draft as it streams
+        run_id: Optional id to checkpoint (and resume) a best-mode run under
         
     Returns:
         {
@@ -1001,101 +2511,375 @@ def generate_bedtime_story(request: str, mode: str = "balanced") -> Dict:
             "category": "...",
             "final_score": 8.5,
             "mode": "balanced",
-            "api_calls": 6,
+            "api_calls": 8,
             "iterations": 1,
             "metadata": {...}
         }
+        
+    Raises:
+        StoryGenError: missing API key, unknown mode, or a failed pipeline
     """
-    print(f"\n{'='*60}")
-    print(f"📖 BEDTIME STORY GENERATOR - {mode.upper()} MODE")
-    print(f"{'='*60}\n")
+    require_client()
+    
+    logger.info("BEDTIME STORY GENERATOR - %s MODE", mode.upper())
     
     if mode == "fast":
-        return generate_bedtime_story_fast(request)
+        return await generate_bedtime_story_fast(request, on_token)
     elif mode == "balanced":
-        return generate_bedtime_story_balanced(request)
+        return await generate_bedtime_story_balanced(request, on_token)
     elif mode == "best":
-        return generate_bedtime_story_best(request)
+        return await generate_bedtime_story_best(request, on_token, run_id)
     else:
-        raise ValueError(f"Unknown mode: {mode}. Choose 'fast', 'balanced', or 'best'")
-
-# ============= UTILITIES =============
-
-def format_issues_list(issues: List[Dict]) -> str:
-    """Format issues for refinement prompt."""
-    formatted = []
-    for i, issue in enumerate(issues, 1):
-        formatted.append(f"""
-Issue {i} [{issue['severity'].upper()}]:
-  Location: {issue['location']}
-  Problem: {issue['problem']}
-  Fix: {issue['fix']}
-        """)
-    return "\n".join(formatted)
+        raise StoryGenError("invalid_mode", f"Unknown mode: {mode}. Choose 'fast', 'balanced', or 'best'", 400)
+
+async def stream_bedtime_story(request: str, mode: str = "balanced") -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Async-generator variant of generate_bedtime_story.
+    
+    Yields ("token", text) for each delta of the first story draft as it arrives
+    from OpenAI, then ("result", result_dict) once the pipeline is done. In
+    balanced/best mode the draft may still be refined, so result["story"] is
+    the authoritative final text.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    task = asyncio.create_task(generate_bedtime_story(request, mode=mode, on_token=queue.put_nowait))
+    task.add_done_callback(lambda _: queue.put_nowait(None))
+    
+    try:
+        while True:
+            token = await queue.get()
+            if token is None:
+                break
+            yield "token", token
+        yield "result", task.result()
+    finally:
+        # Stop the pipeline if the consumer went away mid-stream
+        task.cancel()
+
+# ============= BATCH API =============
+
+# OpenAI Batch API: ~50% of the per-token price, results within the completion window
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+
+async def submit_chat_batch(bodies: Dict[str, Dict]) -> str:
+    """
+    Submit chat completion requests to the OpenAI Batch API.
+    
+    Args:
+        bodies: custom_id -> chat completion request body
+        
+    Returns:
+        Batch ID to poll with collect_chat_batch
+    """
+    require_client()
+    
+    lines = [
+        orjson.dumps({"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body})
+        for custom_id, body in bodies.items()
+    ]
+    try:
+        batch_file = await client.files.create(
+            file=("story_batch.jsonl", b"\n".join(lines)),
+            purpose="batch"
+        )
+        batch = await client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=BATCH_COMPLETION_WINDOW
+        )
+    except APIError as e:
+        raise StoryGenError("batch_failed", f"Could not submit story batch: {e.message}", 502) from e
+    logger.info("Submitted batch %s with %s request(s)", batch.id, len(bodies))
+    return batch.id
+
+async def collect_chat_batch(batch_id: str) -> Dict:
+    """
+    Check a batch and collect its completions once it has finished.
+    
+    Returns:
+        {
+            "status": "validating" | "in_progress" | "completed" | "failed" | ...,
+            "outputs": {custom_id: message content}  # only when completed
+        }
+    """
+    require_client()
+    
+    try:
+        batch = await client.batches.retrieve(batch_id)
+    except APIError as e:
+        raise StoryGenError("batch_failed", f"Could not check story batch: {e.message}", 502) from e
+    if batch.status != "completed":
+        return {"status": batch.status}
+    
+    outputs = {}
+    if batch.output_file_id:
+        try:
+            content = await client.files.content(batch.output_file_id)
+        except APIError as e:
+            raise StoryGenError("batch_failed", f"Could not download story batch: {e.message}", 502) from e
+        for line in content.text.splitlines():
+            record = orjson.loads(line)
+            response = record.get("response") or {}
+            if response.get("status_code") == 200:
+                outputs[record["custom_id"]] = response["body"]["choices"][0]["message"]["content"].strip()
+            else:
+                logger.error("Batch request %s failed: %s", record['custom_id'], record.get('error'))
+    return {"status": batch.status, "outputs": outputs}
+
+async def submit_story_batch(request: str) -> Dict:
+    """
+    Queue a story on the Batch API instead of generating it interactively.
+    
+    Categorization runs right away (1 quick call); the expensive
+    story generation is batched with the one-shot strong-constraints prompt,
+    since a batch cannot run the interactive judge/refine loop.
+    
+    Returns:
+        {"batch_id": "...", "category_info": {...}}
+    """
+    require_client()
+    
+    category_info = await categorize_story_request(request)
+    character_names = await generate_unique_character_names(request, category_info, 3)
+    prompt = build_strong_constraints_prompt(request, category_info, character_names)
+    
+    batch_id = await submit_chat_batch({
+        "story": {
+            "model": MODEL,
+            "messages": chat_messages(SYSTEM_ONE_SHOT_AUTHOR, prompt),
+            "prompt_cache_key": prompt_cache_key(SYSTEM_ONE_SHOT_AUTHOR),
+            "temperature": 0.7,
+            "max_tokens": 700
+        }
+    })
+    return {"batch_id": batch_id, "category_info": asdict(category_info)}
+
+# Seconds between status checks while generate_bedtime_story_batch waits on a stage
+BATCH_POLL_SECONDS = 60
+BATCH_FAILED_STATUSES = frozenset(("failed", "expired", "cancelled"))
+
+async def run_chat_batch(bodies: Dict[str, Dict], poll_seconds: float = BATCH_POLL_SECONDS) -> Dict[str, str]:
+    """
+    Submit a batch and wait until it finishes.
+    
+    Returns:
+        custom_id -> message content (failed requests are missing)
+    """
+    batch_id = await submit_chat_batch(bodies)
+    while True:
+        batch = await collect_chat_batch(batch_id)
+        if batch["status"] == "completed":
+            return batch["outputs"]
+        if batch["status"] in BATCH_FAILED_STATUSES:
+            raise StoryGenError("batch_failed", f"Story batch {batch_id} {batch['status']}", 502)
+        await asyncio.sleep(poll_seconds)
+
+async def generate_bedtime_story_batch(requests: List[str], poll_seconds: float = BATCH_POLL_SECONDS,
+                                      judge: bool = False) -> List[Dict]:
+    """
+    Generate many stories offline through the Batch API, one batch per stage.
+    
+    Stages: categorize all requests -> write the stories with the
+    strong-constraints prompt (a batch can't run the interactive judge/refine
+    loop); character names are drawn locally in between. Each stage reuses the
+    interactive prompt builders and starts when the previous batch completes,
+    so a run can take up to two completion windows, at roughly half the
+    per-token price. With judge set, the finished stories are then scored
+    interactively by judge_stories_batch, several stories per call.
+    
+    Args:
+        requests: Story requests
+        poll_seconds: Delay between batch status checks
+        judge: Score the stories once they are written
+        
+    Returns:
+        One result per request, in order, shaped like generate_bedtime_story's
+        fast-mode result (minus the per-story API call count); "story" is None
+        for a request whose story failed inside the batch
+    """
+    require_client()
+    ids = [f"story-{i}" for i in range(len(requests))]
+    
+    def body(system, prompt, temperature, max_tokens, **extra):
+        return {
+            "model": MODEL,
+            "messages": chat_messages(system, prompt),
+            "prompt_cache_key": prompt_cache_key(system),
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            **extra
+        }
+    
+    # Stage 1: categorize
+    outputs = await run_chat_batch({
+        cid: body(SYSTEM_CATEGORIZER, build_categorization_prompt(req), 0.3, 150, response_format={"type": "json_object"})
+        for cid, req in zip(ids, requests)
+    }, poll_seconds)
+    category_infos = {}
+    for cid in ids:
+        try:
+            category_infos[cid] = CategoryInfo.from_dict(load_json_completion(outputs[cid]))
+        except (KeyError, TypeError, ValueError):
+            category_infos[cid] = FALLBACK_CATEGORY_INFO
+    
+    # Character names come from the local bank, no batch needed
+    character_names = {cid: pick_character_names(category_infos[cid].category, 3) for cid in ids}
+    
+    # Stage 2: stories
+    outputs = await run_chat_batch({
+        cid: body(SYSTEM_ONE_SHOT_AUTHOR, build_strong_constraints_prompt(req, category_infos[cid], character_names[cid]), 0.7, 700)
+        for cid, req in zip(ids, requests)
+    }, poll_seconds)
+    
+    results = []
+    for cid, req in zip(ids, requests):
+        category_info = category_infos[cid]
+        results.append({
+            "request": req,
+            "story": outputs.get(cid),
+            "category": category_info.category,
+            "themes": list(category_info.themes),
+            "tone": category_info.tone,
+            "mode": "batch",
+            "final_score": "N/A (not evaluated)",
+            "iterations": 1,
+            "metadata": {
+                "plan_used": "strong_constraints",
+                "character_names": character_names[cid],
+                "batched": True
+            }
+        })
+    
+    # Optional stage 3: score the finished stories
+    if judge:
+        judged = [result for result in results if result["story"]]
+        judgments = await judge_stories_batch([
+            (result["story"], result["request"], category_infos[cid])
+            for cid, result in zip(ids, results) if result["story"]
+        ])
+        for result, judgment in zip(judged, judgments):
+            result["final_score"] = judgment["overall_score"]
+            result["metadata"]["judge_verdict"] = judgment["verdict"]
+    return results
 
 # ============= MAIN =============
 
+EXAMPLES = (
+    "A story about a little dragon who is afraid of the dark",
+    "Tell me about a brave bunny who goes on an adventure",
+    "A story about making new friends at school",
+    "An adventure where a shy turtle makes friends while searching for a magical shell"
+)
+
+MODE_MAP = {"1": "fast", "2": "balanced", "3": "best", "": "balanced"}
+MODE_MENU_TEXT = "\n".join([
+    "\n" + "-"*60,
+    "Select quality mode:",
+    "1. Fast (5-8 sec, 2 API calls, good quality)",
+    "2. Balanced (12-15 sec, 3-6 API calls, great quality) [DEFAULT]",
+    "3. Best (20-30 sec, 6-11 API calls, excellent quality)"
+])
+
 def main():
     """Interactive CLI for story generation."""
-    print("\n" + "="*60)
-    print("BEDTIME STORY GENERATOR")
-    print("="*60)
-    
-    # Example requests
-    examples = [
-        "A story about a little dragon who is afraid of the dark",
-        "Tell me about a brave bunny who goes on an adventure", 
-        "A story about making new friends at school",
-        "An adventure where a shy turtle makes friends while searching for a magical shell"
-    ]
+    global COMPLETION_CACHE_ENABLED
+    
+    parser = argparse.ArgumentParser(description="Generate a bedtime story interactively.")
+    parser.add_argument("--cache", action="store_true",
+                        help="Replay categorizer/judge answers for prompts answered before")
+    parser.add_argument("--quiet", action="store_true",
+                        help="Leave out the decorative banners")
+    parser.add_argument("--run-id", metavar="ID",
+                        help="Checkpoint a best-mode run under ID; rerun with the same ID to resume it")
+    args = parser.parse_args()
+    if args.cache:
+        COMPLETION_CACHE_ENABLED = True
+    # Load the embedding model while the user is still typing
+    threading.Thread(target=CATEGORY_SEMANTIC_CACHE.load_model, daemon=True).start()
     
-    print("\nExample requests:")
-    for i, ex in enumerate(examples, 1):
-        print(f"{i}. {ex}")
+    # Banners only help a person reading a terminal, not a pipe or a file
+    banners = not args.quiet and sys.stdout.isatty()
+    rule = "="*60
     
-    # Get request
-    user_input = input("\nEnter your story request (or press Enter for example 1): ").strip()
-    if not user_input:
-        request = examples[0]
-        print(f"Using example: {request}")
+    lines = [rule, "BEDTIME STORY GENERATOR", rule] if banners else []
+    lines.append("\nExample requests:")
+    lines.extend(f"{i}. {ex}" for i, ex in enumerate(EXAMPLES, 1))
+    print("\n".join(lines))
+    
+    # An interrupted run picks up its own request in best mode
+    checkpoint = memo_get(checkpoint_key(args.run_id)) if args.run_id else None
+    if checkpoint:
+        request, mode = checkpoint["request"], "best"
+        print(f"\nResuming run {args.run_id}: {request}")
     else:
-        request = user_input
+        # Get request
+        user_input = input("\nEnter your story request (or press Enter for example 1): ").strip()
+        if not user_input:
+            request = EXAMPLES[0]
+            print(f"Using example: {request}")
+        else:
+            request = user_input
+        
+        # Select mode
+        print(MODE_MENU_TEXT)
+        
+        mode_input = input("\nEnter mode (1/2/3) or press Enter for Balanced: ").strip()
+        mode = MODE_MAP.get(mode_input, "balanced")
+    
+    story_header = ["", rule, "📚 YOUR BEDTIME STORY", rule, ""] if banners else []
     
-    # Select mode
-    print("\n" + "-"*60)
-    print("Select quality mode:")
-    print("1. Fast (5-8 sec, 2 API calls, good quality)")
-    print("2. Balanced (12-15 sec, 5-6 API calls, great quality) [DEFAULT]")  
-    print("3. Best (20-30 sec, 8-10 API calls, excellent quality)")
+    # Fast mode's first draft is the final story, so it is shown as it is
+    # written; the other modes may still refine it and show the final text
+    streamed = []
+    def show_token(token: str):
+        if not streamed:
+            sys.stdout.write("\n".join(story_header + [""]))
+        streamed.append(token)
+        sys.stdout.write(token)
+        sys.stdout.flush()
     
-    mode_input = input("\nEnter mode (1/2/3) or press Enter for Balanced: ").strip()
-    mode_map = {"1": "fast", "2": "balanced", "3": "best", "": "balanced"}
-    mode = mode_map.get(mode_input, "balanced")
+    async def generate():
+        # The pool's connections belong to this event loop; close them before it ends
+        try:
+            return await generate_bedtime_story(request, mode=mode, on_token=show_token if mode == "fast" else None,
+                                                run_id=args.run_id)
+        finally:
+            await close_client()
     
     # Generate story
     print(f"\n🎬 Starting generation in {mode.upper()} mode...\n")
-    result = generate_bedtime_story(request, mode=mode)
-    
-    # Display results
-    print("\n" + "="*60)
-    print("📚 YOUR BEDTIME STORY")
-    print("="*60 + "\n")
-    print(result["story"])
-    print("\n" + "="*60)
-    print(f"Mode: {result['mode']}")
-    print(f"Category: {result.get('category', 'N/A')}")
-    print(f"Quality Score: {result.get('final_score', 'N/A')}")
-    print(f"API Calls Used: {result.get('api_calls', 'N/A')}")
-    print(f"Refinement Iterations: {result.get('iterations', 'N/A')}")
+    try:
+        result = asyncio.run(generate())
+    except StoryGenError as e:
+        print(f"\n❌ {e.msg} ({e.code})\n")
+        return
+    
+    # Display results, written out in one go (the story too unless it was streamed as-is)
+    if streamed and "".join(streamed).strip() == result["story"]:
+        lines = [""]
+    else:
+        if streamed:
+            story_header = ["", "", "(The streamed draft was replaced; final story below)"] + story_header
+        lines = story_header + [result["story"]]
+    lines += [
+        "\n" + rule if banners else "",
+        f"Mode: {result['mode']}",
+        f"Category: {result.get('category', 'N/A')}",
+        f"Quality Score: {result.get('final_score', 'N/A')}",
+        f"API Calls Used: {result.get('api_calls', 'N/A')}",
+        f"Refinement Iterations: {result.get('iterations', 'N/A')}"
+    ]
     
     # Show metadata if available
     metadata = result.get('metadata', {})
     if metadata:
-        print("\nAdditional Info:")
-        for key, value in metadata.items():
-            print(f"  {key}: {value}")
+        lines.append("\nAdditional Info:")
+        lines.extend(f"  {key}: {value}" for key, value in metadata.items())
     
-    print("="*60 + "\n")
+    if banners:
+        lines.append(rule + "\n")
+    sys.stdout.write("\n".join(lines) + "\n")
 
 if __name__ == "__main__":
     main()